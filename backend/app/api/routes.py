@@ -1,9 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse
 from app.services.generator import generate_members
-from app.models.member import MemberConfig, Member, MemberUpdate
+from app.models.member import MemberConfig, Member, MemberUpdate, MemberSearchHit, MemberSearchResults
 from app.models.custom_field import CustomFieldDefinition, CustomFieldCreate, CustomFieldUpdate, CustomFieldValue
+from app.models.analytics import DatasetAnalytics
 from app.core.config import get_db
+from app.core.startup import startup_state
+from app.core.writer import PartialWriteError, run_write
+from app.services.analytics import get_analytics
+from app.services.members import MEMBER_ROWS_SQL, fetch_members, member_from_row, parse_json_field
+from app.services.record_cache import CUSTOM_FIELD_CATALOG, custom_field_cache, member_cache
+from app.services.search import SEARCH_FIELDS, drop_search_field, refresh_search_index, search_members
+from app.services.uniqueness import member_keys, registry
 from typing import List, Any, Optional
 from uuid import UUID
 from io import BytesIO
@@ -12,14 +20,10 @@ import json
 
 router = APIRouter()
 
-def parse_json_field(field: Any) -> Optional[dict]:
-    """Parse a field that might be a JSON string into a dictionary."""
-    if isinstance(field, str):
-        try:
-            return json.loads(field)
-        except json.JSONDecodeError:
-            return None
-    return field if isinstance(field, dict) else None
+@router.get("/ready")
+def readiness():
+    status = startup_state.status()
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
 
 @router.post("/generate", response_model=List[Member])
 def create_members(config: MemberConfig):
@@ -54,86 +58,138 @@ def list_members():
         for row in (members_result or [])
     ]
 
-@router.get("/members/{member_id}", response_model=Member)
-def get_member(member_id: UUID):
+@router.get("/members/search", response_model=MemberSearchResults)
+def search(
+    q: str = Query(..., min_length=1),
+    field: Optional[str] = None,
+    fuzzy: bool = True,
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+):
     db = get_db()
-    result = db.execute("""
-        SELECT m.*, json_group_object(cf.name, cfv.value) as custom_fields
-        FROM members m
-        LEFT JOIN custom_field_values cfv ON m.id = cfv.member_id
-        LEFT JOIN custom_field_definitions cf ON cfv.field_id = cf.id
-        WHERE m.id = ?
-        GROUP BY m.id, m.date_member_joined_group, m.first_name, m.surname, 
-                 m.birthday, m.phone_number, m.email, m.address, m.latitude, m.longitude
-    """, [str(member_id)]).fetchone()
     
-    if not result:
-        raise HTTPException(status_code=404, detail="Member not found")
+    if field is not None and field not in SEARCH_FIELDS:
+        # Custom fields are indexed by id, so they can be renamed without re-indexing
+        field_result = db.execute("SELECT id FROM custom_field_definitions WHERE name = ?", [field]).fetchone()
+        if not field_result:
+            raise HTTPException(status_code=400, detail=f"Unknown search field: {field}")
+        field = str(field_result[0])
     
-    custom_fields = parse_json_field(result[10])
+    total, hits = search_members(db, q, field=field, fuzzy=fuzzy, limit=limit, offset=offset)
+    # The whole page in one query rather than a get_member() per hit
+    members = fetch_members(db, [member_id for member_id, _ in hits])
     
-    return Member(
-        id=result[0] if isinstance(result[0], UUID) else UUID(result[0]),
-        date_member_joined_group=result[1],
-        first_name=result[2],
-        surname=result[3],
-        birthday=result[4],
-        phone_number=result[5],
-        email=result[6],
-        address=result[7],
-        latitude=result[8],
-        longitude=result[9],
-        custom_fields=custom_fields if custom_fields != '{}' else None
+    return MemberSearchResults(
+        total=total,
+        limit=limit,
+        offset=offset,
+        # A member deleted since the index was searched is left out
+        results=[MemberSearchHit(member=members[str(member_id)], score=score)
+                 for member_id, score in hits if str(member_id) in members]
     )
 
-@router.patch("/members/{member_id}", response_model=Member)
-def update_member(member_id: UUID, member_update: MemberUpdate):
-    db = get_db()
+@router.get("/members/{member_id}", response_model=Member)
+def get_member(member_id: UUID):
+    def load():
+        db = get_db()
+        return db.execute(MEMBER_ROWS_SQL.format(where="m.id = ?"), [str(member_id)]).fetchone()
     
-    if not db.execute("SELECT 1 FROM members WHERE id = ?", [str(member_id)]).fetchone():
+    # The raw row is cached rather than the Member, as a tuple takes a fraction of the memory
+    result = member_cache.get(str(member_id), load)
+    if not result:
         raise HTTPException(status_code=404, detail="Member not found")
     
+    return member_from_row(result)
+
+@router.patch("/members/{member_id}", response_model=Member)
+def update_member(member_id: UUID, member_update: MemberUpdate):
+    def write(db):
+        old_keys = member_keys(db, member_id)
+        if not old_keys:
+            raise HTTPException(status_code=404, detail="Member not found")
+        
+        
+        update_fields = {k: v for k, v in member_update.model_dump().items() 
+                        if v is not None and k != 'custom_fields'}
+        
+        if update_fields:
+            set_clause = ", ".join(f"{k} = ?" for k in update_fields.keys())
+            values = list(update_fields.values())
+            values.append(str(member_id))
+            db.execute(f"UPDATE members SET {set_clause} WHERE id = ?", values)
+        
+        
+        if member_update.custom_fields:
+            for field_name, value in member_update.custom_fields.items():
+                
+                field_result = db.execute(
+                    "SELECT id FROM custom_field_definitions WHERE name = ?", 
+                    [field_name]
+                ).fetchone()
+                
+                if field_result:
+                    field_id = field_result[0]
+                    db.execute("""
+                        INSERT INTO custom_field_values (member_id, field_id, value)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT (member_id, field_id) DO UPDATE SET value = excluded.value
+                    """, [str(member_id), field_id, value])
+        
+        refresh_search_index(db, [member_id])
+        return old_keys, member_keys(db, member_id)
     
-    update_fields = {k: v for k, v in member_update.model_dump().items() 
-                    if v is not None and k != 'custom_fields'}
-    
-    if update_fields:
-        set_clause = ", ".join(f"{k} = ?" for k in update_fields.keys())
-        values = list(update_fields.values())
-        values.append(str(member_id))
-        db.execute(f"UPDATE members SET {set_clause} WHERE id = ?", values)
-    
-    
-    if member_update.custom_fields:
-        for field_name, value in member_update.custom_fields.items():
-            
-            field_result = db.execute(
-                "SELECT id FROM custom_field_definitions WHERE name = ?", 
-                [field_name]
-            ).fetchone()
-            
-            if field_result:
-                field_id = field_result[0]
-                db.execute("""
-                    INSERT INTO custom_field_values (member_id, field_id, value)
-                    VALUES (?, ?, ?)
-                    ON CONFLICT (member_id, field_id) DO UPDATE SET value = excluded.value
-                """, [str(member_id), field_id, value])
-    
+    old_keys, new_keys = run_write(write)
+    registry.update_member(old_keys, new_keys)
+    member_cache.invalidate(str(member_id))
     return get_member(member_id)
 
 @router.delete("/members/{member_id}")
 def delete_member(member_id: UUID):
-    db = get_db()
-    if not db.execute("SELECT 1 FROM members WHERE id = ?", [str(member_id)]).fetchone():
-        raise HTTPException(status_code=404, detail="Member not found")
-    
-    
-    db.execute("DELETE FROM custom_field_values WHERE member_id = ?", [str(member_id)])
+    def delete_values(db):
+        if not db.execute("SELECT 1 FROM members WHERE id = ?", [str(member_id)]).fetchone():
+            raise HTTPException(status_code=404, detail="Member not found")
+        
+        
+        values = db.execute(
+            "SELECT member_id, field_id, value FROM custom_field_values WHERE member_id = ?", [str(member_id)]
+        ).fetchall()
+        db.execute("DELETE FROM custom_field_values WHERE member_id = ?", [str(member_id)])
+        return values
     
-    db.execute("DELETE FROM members WHERE id = ?", [str(member_id)])
+    def delete(db):
+        keys = member_keys(db, member_id)
+        db.execute("DELETE FROM members WHERE id = ?", [str(member_id)])
+        refresh_search_index(db, [member_id])
+        return keys
+
+    # DuckDB only allows deleting the member once the deletion of its values is committed
+    try:
+        keys = run_write(delete_values, delete)
+    except PartialWriteError as e:
+        # Only the values were deleted, so put them back rather than leave the member without them
+        restore_custom_field_values(e.results[0])
+        raise e.__cause__
+    member_cache.invalidate(str(member_id))
+    if keys:
+        registry.remove_member(keys)
     return JSONResponse(content={"message": "Member deleted successfully"})
 
+def restore_custom_field_values(values: List[tuple]) -> None:
+    """Puts back the custom field values deleted by a delete whose second stage failed, and re-indexes them."""
+    if not values:
+        return
+
+    def write(db):
+        db.executemany("""
+            INSERT INTO custom_field_values (member_id, field_id, value)
+            VALUES (?, ?, ?)
+        """, [(str(member_id), str(field_id), value) for member_id, field_id, value in values])
+        refresh_search_index(db, list({member_id for member_id, _, _ in values}))
+
+    run_write(write)
+    # Members read between the two stages were cached without these values
+    member_cache.invalidate(*{str(member_id) for member_id, _, _ in values})
+
 @router.get("/download/{format}")
 def download_members(format: str):
     db = get_db()
@@ -160,6 +216,14 @@ def download_members(format: str):
     else:
         raise HTTPException(status_code=400, detail="Unsupported format")
 
+@router.get("/analytics", response_model=DatasetAnalytics)
+def dataset_analytics():
+    return get_analytics()
+
+@router.get("/cache/stats")
+def cache_stats():
+    return {"members": member_cache.stats(), "custom_fields": custom_field_cache.stats()}
+
 @router.post("/custom-fields", response_model=CustomFieldDefinition)
 def create_custom_field(field: CustomFieldCreate):
     if not field.name:
@@ -169,31 +233,41 @@ def create_custom_field(field: CustomFieldCreate):
     if field.field_type not in valid_field_types:
         raise HTTPException(status_code=422, detail=f"Field type must be one of: {', '.join(valid_field_types)}")
         
-    db = get_db()
     field_def = CustomFieldDefinition(**field.model_dump())
     
-    db.execute("""
-        INSERT INTO custom_field_definitions (id, name, field_type, validation_rules)
-        VALUES (?, ?, ?, ?)
-    """, [str(field_def.id), field_def.name, field_def.field_type, field_def.validation_rules])
-    
-    
-    members = db.execute("SELECT id FROM members").fetchall()
-    if members:
+    def write(db):
+        db.execute("""
+            INSERT INTO custom_field_definitions (id, name, field_type, validation_rules)
+            VALUES (?, ?, ?, ?)
+        """, [str(field_def.id), field_def.name, field_def.field_type, field_def.validation_rules])
         
-        default_value = ""  # TODO: Make this more sophisticated based on field type
-        values = [(str(member[0]), str(field_def.id), default_value) for member in members]
-        db.executemany("""
-            INSERT INTO custom_field_values (member_id, field_id, value)
-            VALUES (?, ?, ?)
-        """, values)
+        
+        members = db.execute("SELECT id FROM members").fetchall()
+        if members:
+            
+            default_value = ""  # TODO: Make this more sophisticated based on field type
+            values = [(str(member[0]), str(field_def.id), default_value) for member in members]
+            db.executemany("""
+                INSERT INTO custom_field_values (member_id, field_id, value)
+                VALUES (?, ?, ?)
+            """, values)
     
+    run_write(write)
+    # Every member got a value for the new field
+    custom_field_cache.invalidate_all()
+    member_cache.invalidate_all()
     return field_def
 
+def custom_field_catalog() -> tuple:
+    """The rows of all custom field definitions, read through the custom field cache."""
+    return custom_field_cache.get(
+        CUSTOM_FIELD_CATALOG,
+        lambda: tuple(get_db().execute("SELECT * FROM custom_field_definitions").fetchall()),
+    )
+
 @router.get("/custom-fields", response_model=List[CustomFieldDefinition])
 def list_custom_fields():
-    db = get_db()
-    result = db.execute("SELECT * FROM custom_field_definitions").fetchall()
+    result = custom_field_catalog()
     
     return [
         CustomFieldDefinition(
@@ -208,8 +282,7 @@ def list_custom_fields():
 
 @router.get("/custom-fields/{field_id}", response_model=CustomFieldDefinition)
 def get_custom_field(field_id: UUID):
-    db = get_db()
-    result = db.execute("SELECT * FROM custom_field_definitions WHERE id = ?", [str(field_id)]).fetchone()
+    result = next((row for row in custom_field_catalog() if str(row[0]) == str(field_id)), None)
     if not result:
         raise HTTPException(status_code=404, detail="Custom field not found")
     
@@ -223,37 +296,58 @@ def get_custom_field(field_id: UUID):
 
 @router.patch("/custom-fields/{field_id}", response_model=CustomFieldDefinition)
 def update_custom_field(field_id: UUID, field_update: CustomFieldUpdate):
-    db = get_db()
-    if not db.execute("SELECT 1 FROM custom_field_definitions WHERE id = ?", [str(field_id)]).fetchone():
-        raise HTTPException(status_code=404, detail="Custom field not found")
-    
-    update_fields = {k: v for k, v in field_update.model_dump().items() if v is not None}
-    if not update_fields:
-        raise HTTPException(status_code=400, detail="No fields to update")
-    
-    if 'validation_rules' in update_fields:
-        if isinstance(update_fields['validation_rules'], str):
-            try:
-                update_fields['validation_rules'] = json.dumps(json.loads(update_fields['validation_rules']))
-            except json.JSONDecodeError:
-                update_fields['validation_rules'] = '{}'
-        else:
-            update_fields['validation_rules'] = json.dumps(update_fields['validation_rules'])
-    
-    set_clause = ", ".join(f"{k} = ?" for k in update_fields.keys())
-    values = list(update_fields.values())
-    values.append(str(field_id))
-    
-    db.execute(f"UPDATE custom_field_definitions SET {set_clause} WHERE id = ?", values)
+    def write(db):
+        if not db.execute("SELECT 1 FROM custom_field_definitions WHERE id = ?", [str(field_id)]).fetchone():
+            raise HTTPException(status_code=404, detail="Custom field not found")
+        
+        update_fields = {k: v for k, v in field_update.model_dump().items() if v is not None}
+        if not update_fields:
+            raise HTTPException(status_code=400, detail="No fields to update")
+        
+        if 'validation_rules' in update_fields:
+            if isinstance(update_fields['validation_rules'], str):
+                try:
+                    update_fields['validation_rules'] = json.dumps(json.loads(update_fields['validation_rules']))
+                except json.JSONDecodeError:
+                    update_fields['validation_rules'] = '{}'
+            else:
+                update_fields['validation_rules'] = json.dumps(update_fields['validation_rules'])
+        
+        set_clause = ", ".join(f"{k} = ?" for k in update_fields.keys())
+        values = list(update_fields.values())
+        values.append(str(field_id))
+        
+        db.execute(f"UPDATE custom_field_definitions SET {set_clause} WHERE id = ?", values)
     
+    run_write(write)
+    custom_field_cache.invalidate_all()
+    if field_update.name is not None:
+        # Cached members list their custom fields by name
+        member_cache.invalidate_all()
     return get_custom_field(field_id)
 
 @router.delete("/custom-fields/{field_id}")
 def delete_custom_field(field_id: UUID):
-    db = get_db()
-    if not db.execute("SELECT 1 FROM custom_field_definitions WHERE id = ?", [str(field_id)]).fetchone():
-        raise HTTPException(status_code=404, detail="Custom field not found")
+    def delete_values(db):
+        if not db.execute("SELECT 1 FROM custom_field_definitions WHERE id = ?", [str(field_id)]).fetchone():
+            raise HTTPException(status_code=404, detail="Custom field not found")
+        
+        values = db.execute(
+            "SELECT member_id, field_id, value FROM custom_field_values WHERE field_id = ?", [str(field_id)]
+        ).fetchall()
+        db.execute("DELETE FROM custom_field_values WHERE field_id = ?", [str(field_id)])
+        drop_search_field(db, field_id)
+        return values
     
-    db.execute("DELETE FROM custom_field_values WHERE field_id = ?", [str(field_id)])
-    db.execute("DELETE FROM custom_field_definitions WHERE id = ?", [str(field_id)])
+    def delete(db):
+        db.execute("DELETE FROM custom_field_definitions WHERE id = ?", [str(field_id)])
+
+    # DuckDB only allows deleting the definition once the deletion of its values is committed
+    try:
+        run_write(delete_values, delete)
+    except PartialWriteError as e:
+        restore_custom_field_values(e.results[0])
+        raise e.__cause__
+    custom_field_cache.invalidate_all()
+    member_cache.invalidate_all()
     return JSONResponse(content={"message": "Custom field deleted successfully"})
\ No newline at end of file
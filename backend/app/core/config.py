@@ -5,6 +5,23 @@ import os
 DB_PATH = Path(__file__).parent.parent.parent / "data" / "members.duckdb"
 TEST_DB_PATH = Path(__file__).parent.parent.parent / "data" / "test_members.duckdb"
 
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+# Nominatim's usage policy allows at most one request per second
+NOMINATIM_REQUESTS_PER_SECOND = float(os.getenv("NOMINATIM_REQUESTS_PER_SECOND", "1"))
+# Seconds to wait for Nominatim or Overpass before giving up (Overpass queries are limited to 25 seconds)
+OSM_REQUEST_TIMEOUT = float(os.getenv("OSM_REQUEST_TIMEOUT", "30"))
+
+# Cities whose addresses are pre-fetched in the background, as "city:country" pairs separated by ";",
+# e.g. "København:Danmark;Aarhus:Danmark"
+HOT_CITIES = os.getenv("HOT_CITIES", "")
+ADDRESS_POOL_SIZE = int(os.getenv("ADDRESS_POOL_SIZE", "500"))
+ADDRESS_POOL_LOW_WATERMARK = int(os.getenv("ADDRESS_POOL_LOW_WATERMARK", "100"))
+ADDRESS_POOL_REFILL_INTERVAL = float(os.getenv("ADDRESS_POOL_REFILL_INTERVAL", "60"))
+
+# Maximum number of member records kept in the in-process read cache
+MEMBER_CACHE_SIZE = int(os.getenv("MEMBER_CACHE_SIZE", "10000"))
+
 def get_db():
     db_path = TEST_DB_PATH if os.getenv("TESTING") else DB_PATH
     db_path.parent.mkdir(exist_ok=True)
@@ -60,4 +77,31 @@ def get_db():
             )
         """).commit()
 
+    if 'member_search_trigrams' not in existing_tables:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS member_search_trigrams (
+                member_id UUID NOT NULL,
+                field VARCHAR NOT NULL,
+                token VARCHAR NOT NULL,
+                trigram VARCHAR NOT NULL
+            )
+        """).commit()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS member_search_tokens (
+                member_id UUID NOT NULL,
+                field VARCHAR NOT NULL,
+                token VARCHAR NOT NULL,
+                trigram_count INTEGER NOT NULL
+            )
+        """).commit()
+
+    if 'generation_cache' not in existing_tables:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation_cache (
+                key VARCHAR PRIMARY KEY,
+                members JSON NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """).commit()
+
     return conn
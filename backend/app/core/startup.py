@@ -0,0 +1,30 @@
+import time
+from typing import Any, Dict, Optional
+
+class StartupState:
+    """Tracks how long the API process took to start and whether the database is bootstrapped."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.imported_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def mark_imported(self) -> None:
+        self.imported_at = time.perf_counter()
+
+    def mark_ready(self) -> None:
+        self.ready_at = time.perf_counter()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "import_seconds": None if self.imported_at is None else round(self.imported_at - self.started_at, 4),
+            "startup_seconds": None if self.ready_at is None else round(self.ready_at - self.started_at, 4),
+        }
+
+# Created when app.main starts importing, so startup_seconds covers the imports and the DB bootstrap
+startup_state = StartupState()
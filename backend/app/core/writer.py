@@ -0,0 +1,162 @@
+import queue
+import threading
+from concurrent.futures import Future
+from app.core.config import get_db
+from typing import Any, Callable, List, Optional, Tuple
+
+class PartialWriteError(Exception):
+    """
+    Raised for a staged job whose stage failed after the earlier stages were committed.
+    The exception raised by the failing stage is the __cause__.
+    Attributes:
+        results (List[Any]): The return values of the committed stages, e.g. the rows they deleted,
+            so the caller can put back or report what was left half done.
+    """
+
+    def __init__(self, results: List[Any]):
+        super().__init__(f"Stage {len(results) + 1} failed after {len(results)} committed stage(s)")
+        self.results = results
+
+class WriteCoordinator:
+    """
+    Serializes every write to the database through a single writer thread.
+
+    Write jobs are functions that take a DuckDB connection. The writer drains whatever jobs are
+    queued (up to max_batch) and runs them in one shared transaction, a group commit, so concurrent
+    requests neither conflict with each other nor pay for a commit each. If a job in a batch fails
+    the transaction is rolled back and the jobs are retried one by one, so only the failing job
+    sees its exception. Jobs may therefore run more than once and should only touch the database.
+
+    A job can also be given as several stages that are committed one after the other, for writes
+    that DuckDB cannot do in a single transaction: a row referenced by a foreign key can only be
+    deleted once the deletion of the referencing rows has been committed. Staged jobs are not
+    grouped with other jobs, and a failing stage stops the job without undoing earlier stages.
+    If a stage other than the first fails, the job raises PartialWriteError with the results of the
+    committed stages.
+
+    Readers keep using their own connections from get_db(), which see the last committed state.
+    """
+
+    def __init__(self, max_batch: int = 64, connect: Callable[[], Any] = get_db):
+        self.max_batch = max_batch
+        self.connect = connect
+        # Incremented after every commit, identifies the state of the dataset for caches
+        self.version = 0
+        self.committed_jobs = 0
+        self.committed_batches = 0
+        self._queue: "queue.Queue[Optional[Tuple[Tuple[Callable[[Any], Any], ...], Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, *stages: Callable[[Any], Any]) -> Any:
+        """
+        Runs a write job on the writer thread and waits for it to be committed.
+        Args:
+            *stages (Callable): Functions taking the writer's DuckDB connection. Usually a single
+                function, several are run and committed in order.
+        Returns:
+            The return value of the last stage, once its transaction has committed. Exceptions raised by the job are re-raised.
+        """
+        self.start()
+        future: Future = Future()
+        self._queue.put((stages, future))
+        return future.result()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Commits the queued jobs and stops the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self) -> None:
+        pending = None
+        while True:
+            item, pending = (pending if pending is not None else self._queue.get()), None
+            if item is None:
+                return
+            if len(item[0]) > 1:
+                self._commit_stages(item)
+                continue
+
+            batch = [(item[0][0], item[1])]
+            stopping = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                if len(item[0]) > 1:
+                    # Staged jobs run on their own once this batch is committed
+                    pending = item
+                    break
+                batch.append((item[0][0], item[1]))
+
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit_stages(self, item: Tuple[Tuple[Callable[[Any], Any], ...], Future]) -> None:
+        stages, future = item
+        results = []
+        for stage in stages:
+            stage_future: Future = Future()
+            self._commit([(stage, stage_future)])
+            error = stage_future.exception()
+            if error is not None:
+                if results:
+                    partial = PartialWriteError(results)
+                    partial.__cause__ = error
+                    error = partial
+                future.set_exception(error)
+                return
+            results.append(stage_future.result())
+        future.set_result(results[-1])
+
+    def _commit(self, batch: List[Tuple[Callable[[Any], Any], Future]]) -> None:
+        try:
+            conn = self.connect()
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        try:
+            conn.begin()
+            results = [job(conn) for job, _ in batch]
+            conn.commit()
+        except BaseException as e:
+            try:
+                conn.rollback()
+            except Exception:
+                pass  # A failed commit has already rolled the transaction back
+            conn.close()
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            else:
+                for item in batch:
+                    self._commit([item])
+            return
+        conn.close()
+
+        self.version += 1
+        self.committed_jobs += len(batch)
+        self.committed_batches += 1
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+writer = WriteCoordinator()
+
+def run_write(*stages: Callable[[Any], Any]) -> Any:
+    """Runs a write job through the process-wide write coordinator, see WriteCoordinator.submit."""
+    return writer.submit(*stages)
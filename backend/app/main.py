@@ -1,8 +1,25 @@
+from app.core.startup import startup_state
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api import routes
+from app.core.config import get_db
+from app.core.writer import run_write, writer
+from app.services.address_pool import start_address_pool, stop_address_pool
+from app.services.search import index_existing_members
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Creates the tables on first start, /ready reports 503 until this is done
+    get_db().close()
+    run_write(index_existing_members)
+    startup_state.mark_ready()
+    start_address_pool()
+    yield
+    stop_address_pool()
+    writer.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,4 +29,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(routes.router)
\ No newline at end of file
+app.include_router(routes.router)
+
+startup_state.mark_imported()
\ No newline at end of file
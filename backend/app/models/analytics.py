@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+class AgeBucket(BaseModel):
+    min_age: int
+    max_age: int
+    count: int
+
+class PeriodCount(BaseModel):
+    period: str
+    count: int
+
+class PostcodeCount(BaseModel):
+    postcode: Optional[str] = None
+    count: int
+
+class ValueCount(BaseModel):
+    value: Optional[str] = None
+    count: int
+
+class DatasetAnalytics(BaseModel):
+    version: int
+    member_count: int
+    age_distribution: List[AgeBucket]
+    join_date_histogram: List[PeriodCount]
+    postcode_counts: List[PostcodeCount]
+    custom_field_frequencies: Dict[str, List[ValueCount]]
\ No newline at end of file
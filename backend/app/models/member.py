@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, field_validator, ValidationInfo
 from datetime import date
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from uuid import UUID, uuid4
 
 class MemberConfig(BaseModel):
@@ -9,6 +9,7 @@ class MemberConfig(BaseModel):
     count: int = Field(default=1, ge=1, le=100)
     min_age: int = Field(default=18, ge=0, le=120)
     max_age: int = Field(default=90, ge=0, le=120)
+    seed: Optional[int] = Field(default=None, ge=0)
     
     @field_validator('max_age')
     @classmethod
@@ -40,4 +41,14 @@ class MemberUpdate(BaseModel):
     address: Optional[str] = None
     latitude: Optional[float] = None
     longitude: Optional[float] = None
-    custom_fields: Optional[Dict[str, str]] = None
\ No newline at end of file
+    custom_fields: Optional[Dict[str, str]] = None
+
+class MemberSearchHit(BaseModel):
+    member: Member
+    score: float
+
+class MemberSearchResults(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    results: List[MemberSearchHit]
\ No newline at end of file
@@ -0,0 +1,177 @@
+import logging
+import random
+import threading
+from collections import deque
+from app.core import config
+from app.services.osm import CityAddresses, lookup_city, fetch_addresses
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds stop() waits for a refill in progress. The refill thread is a daemon, so one still
+# waiting on OpenStreetMap is abandoned rather than holding up shutdown.
+STOP_TIMEOUT = 5.0
+
+class CityAddressPool:
+    """
+    Pre-fetched, pre-filtered addresses for one city. Addresses are handed out once, in random order.
+    """
+
+    def __init__(self, city: str, country: str):
+        self.city = city
+        self.country = country
+        # Nominatim result for the city, looked up once so refills only hit Overpass
+        self.city_data: Optional[Dict[str, Any]] = None
+        # The result of the latest refill, kept so a short pool can still be topped up by synthesis
+        self.city_addresses: Optional[CityAddresses] = None
+        self._addresses: Deque[Tuple[str, float, float]] = deque()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._addresses)
+
+    def take(self, count: int) -> List[Tuple[str, float, float]]:
+        """Removes and returns up to `count` addresses from the pool in O(count)."""
+        with self._lock:
+            return [self._addresses.popleft() for _ in range(min(count, len(self._addresses)))]
+
+    def refill(self, size: int) -> int:
+        """
+        Fetches the city's addresses and tops the pool up to `size`.
+        Returns:
+            int: The number of addresses added.
+        """
+        if self.city_data is None:
+            self.city_data = lookup_city(self.city, self.country)
+        self.city_addresses = fetch_addresses(self.city_data, self.city, self.country)
+        addresses = list(self.city_addresses.addresses)
+        random.shuffle(addresses)
+
+        with self._lock:
+            queued = set(self._addresses)
+            missing = size - len(self._addresses)
+            added = [address for address in addresses if address not in queued][:max(missing, 0)]
+            self._addresses.extend(added)
+        return len(added)
+
+class AddressPoolScheduler:
+    """
+    Keeps an address pool per hot city filled from a background thread. A pool is refilled
+    when it drops below `low_watermark`, either on the next periodic check or immediately
+    when a take() leaves it below the watermark.
+    """
+
+    def __init__(self, cities: List[Tuple[str, str]], size: int = config.ADDRESS_POOL_SIZE,
+                 low_watermark: int = config.ADDRESS_POOL_LOW_WATERMARK,
+                 refill_interval: float = config.ADDRESS_POOL_REFILL_INTERVAL):
+        self.size = size
+        self.low_watermark = low_watermark
+        self.refill_interval = refill_interval
+        self.pools = {_pool_key(city, country): CityAddressPool(city, country) for city, country in cities}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="address-pool-refill", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=STOP_TIMEOUT)
+            self._thread = None
+
+    def take(self, city: str, country: str, count: int) -> Optional[List[Tuple[str, float, float]]]:
+        """
+        Takes up to `count` addresses from the city's pool.
+        Returns:
+            Optional[List[Tuple[str, float, float]]]: The addresses, or None if the city is not a hot city.
+        """
+        pool = self.pools.get(_pool_key(city, country))
+        if pool is None:
+            return None
+
+        addresses = pool.take(count)
+        if len(pool) < self.low_watermark:
+            self._wake.set()
+        return addresses
+
+    def city_addresses(self, city: str, country: str) -> Optional[CityAddresses]:
+        """Returns what the latest refill fetched for a hot city, or None if it has not been refilled yet."""
+        pool = self.pools.get(_pool_key(city, country))
+        return pool.city_addresses if pool is not None else None
+
+    def refill(self) -> None:
+        """Refills every pool that is below the low watermark."""
+        for pool in self.pools.values():
+            if self._stop.is_set():
+                return
+            if len(pool) >= self.low_watermark:
+                continue
+            try:
+                pool.refill(self.size)
+            except Exception:
+                # Overpass is regularly slow or rate limited, the next round will try again
+                logger.warning("Refilling the address pool for %s, %s failed", pool.city, pool.country, exc_info=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.refill()
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
+
+def _pool_key(city: str, country: str) -> Tuple[str, str]:
+    return city.strip().lower(), country.strip().lower()
+
+def parse_hot_cities(value: str) -> List[Tuple[str, str]]:
+    """Parses "city:country" pairs separated by ";", as used by the HOT_CITIES setting."""
+    cities = []
+    for entry in value.split(';'):
+        if ':' in entry:
+            city, country = entry.split(':', 1)
+            if city.strip() and country.strip():
+                cities.append((city.strip(), country.strip()))
+    return cities
+
+_scheduler: Optional[AddressPoolScheduler] = None
+
+def start_address_pool(cities: Optional[List[Tuple[str, str]]] = None, **kwargs) -> Optional[AddressPoolScheduler]:
+    """Starts the background refill of the address pools for the configured hot cities."""
+    global _scheduler
+    stop_address_pool()
+    cities = parse_hot_cities(config.HOT_CITIES) if cities is None else cities
+    if not cities:
+        return None
+
+    _scheduler = AddressPoolScheduler(cities, **kwargs)
+    _scheduler.start()
+    return _scheduler
+
+def stop_address_pool() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
+
+def take_pooled_addresses(city: str, country: str, count: int) -> Optional[List[Tuple[str, float, float]]]:
+    """
+    Takes up to `count` pre-fetched addresses for a hot city.
+    Returns:
+        Optional[List[Tuple[str, float, float]]]: The addresses, or None if there is no pool for the city.
+    """
+    if _scheduler is None:
+        return None
+    return _scheduler.take(city, country, count)
+
+def pooled_city_addresses(city: str, country: str) -> Optional[CityAddresses]:
+    """
+    Returns what the address pool last fetched for a hot city.
+    Returns:
+        Optional[CityAddresses]: The fetched addresses, or None if there is no refilled pool for the city.
+    """
+    if _scheduler is None:
+        return None
+    return _scheduler.city_addresses(city, country)
@@ -0,0 +1,60 @@
+from app.services.osm import CityAddresses
+from typing import TYPE_CHECKING, List, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Standard deviation of the coordinate jitter, roughly the length of a city block
+JITTER_METRES = 75.0
+METRES_PER_DEGREE_LATITUDE = 111_320.0
+
+def synthesize_addresses(city_addresses: CityAddresses, count: int, country: str,
+                         rng: "np.random.Generator") -> List[Tuple[str, float, float]]:
+    """
+    Synthesizes plausible addresses from the OpenStreetMap nodes already fetched for a city.
+    Street and postcode are sampled together from the fetched nodes, so they follow the city's
+    real distribution, the house number is drawn from the range seen on that street, and the
+    coordinates are jittered around the sampled node and kept within the city's bounding box.
+    Args:
+        city_addresses (CityAddresses): What was fetched for the city, see fetch_city_addresses.
+        count (int): The number of addresses to synthesize.
+        country (str): The country, used in the formatted address.
+        rng (np.random.Generator): Random generator used for the sampling.
+    Returns:
+        List[Tuple[str, float, float]]: A list of tuples containing (address, latitude, longitude).
+            Empty if nothing was fetched for the city.
+    """
+    if count <= 0 or not city_addresses.streets:
+        return []
+
+    import numpy as np
+
+    streets, postcodes, numbers, lats, lons = zip(*city_addresses.streets)
+    street_names, street_index = np.unique(np.array(streets, dtype=object), return_inverse=True)
+    postcodes = np.array(postcodes, dtype=object)
+    numbers = np.array(numbers, dtype=np.int64)
+    lats = np.array(lats, dtype=np.float64)
+    lons = np.array(lons, dtype=np.float64)
+
+    # Highest house number seen on each street
+    max_numbers = np.ones(len(street_names), dtype=np.int64)
+    np.maximum.at(max_numbers, street_index, numbers)
+
+    picks = rng.integers(0, len(lats), size=count)
+    picked_streets = street_index[picks]
+    house_numbers = rng.integers(1, max_numbers[picked_streets] + 1)
+
+    south, north, west, east = city_addresses.bbox
+    sampled_lats = lats[picks]
+    jitter_lat = rng.normal(0.0, JITTER_METRES / METRES_PER_DEGREE_LATITUDE, size=count)
+    jitter_lon = rng.normal(0.0, JITTER_METRES, size=count) / (METRES_PER_DEGREE_LATITUDE * np.cos(np.radians(sampled_lats)))
+    out_lats = np.clip(sampled_lats + jitter_lat, south, north)
+    out_lons = np.clip(lons[picks] + jitter_lon, west, east)
+
+    return [
+        (f"{street} {number}, {postcode}, {city_addresses.city_name}, {country}", float(lat), float(lon))
+        for street, number, postcode, lat, lon in zip(
+            street_names[picked_streets], house_numbers.tolist(), postcodes[picks],
+            out_lats.tolist(), out_lons.tolist()
+        )
+    ]
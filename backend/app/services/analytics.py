@@ -0,0 +1,97 @@
+import threading
+from app.core.config import get_db
+from app.core.writer import writer
+from app.models.analytics import DatasetAnalytics, AgeBucket, PeriodCount, PostcodeCount, ValueCount
+from typing import Optional, Tuple
+
+AGE_BUCKET_YEARS = 10
+
+_cache: Optional[Tuple[int, DatasetAnalytics]] = None
+_cache_lock = threading.Lock()
+
+def get_analytics() -> DatasetAnalytics:
+    """
+    Returns the dataset analytics, computing them only if the dataset changed since they were last computed.
+    The cache is keyed on the write coordinator's version, so every committed write invalidates it.
+    Returns:
+        DatasetAnalytics: The aggregates for the current dataset.
+    """
+    global _cache
+    # Read before computing, so a write that lands during the computation makes the next call recompute
+    version = writer.version
+    with _cache_lock:
+        if _cache is not None and _cache[0] == version:
+            return _cache[1]
+
+    analytics = compute_analytics(get_db(), version)
+    with _cache_lock:
+        _cache = (version, analytics)
+    return analytics
+
+def clear_analytics_cache() -> None:
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+def compute_analytics(db, version: int = 0) -> DatasetAnalytics:
+    """
+    Aggregates the members and their custom field values in DuckDB, so only the aggregates leave the database.
+    Args:
+        db: An open DuckDB connection.
+        version (int): The dataset version the analytics are computed for.
+    Returns:
+        DatasetAnalytics: Member count, age distribution, join date histogram (per month),
+            member count per postcode and value frequencies per custom field.
+    """
+    member_count = db.execute("SELECT count(*) FROM members").fetchone()[0]
+
+    ages = db.execute(f"""
+        SELECT floor(date_part('year', age(current_date, birthday)) / {AGE_BUCKET_YEARS}) * {AGE_BUCKET_YEARS} AS bucket,
+               count(*)
+        FROM members
+        WHERE birthday IS NOT NULL
+        GROUP BY bucket
+        ORDER BY bucket
+    """).fetchall()
+
+    joined = db.execute("""
+        SELECT strftime(date_trunc('month', date_member_joined_group), '%Y-%m') AS period, count(*)
+        FROM members
+        WHERE date_member_joined_group IS NOT NULL
+        GROUP BY period
+        ORDER BY period
+    """).fetchall()
+
+    # Addresses are formatted "street number, postcode, city, country"
+    postcodes = db.execute("""
+        SELECT nullif(trim(split_part(address, ',', 2)), '') AS postcode, count(*) AS count
+        FROM members
+        GROUP BY postcode
+        ORDER BY count DESC, postcode
+    """).fetchall()
+
+    values = db.execute("""
+        SELECT cf.name, cfv.value, count(*) AS count
+        FROM custom_field_values cfv
+        JOIN custom_field_definitions cf ON cfv.field_id = cf.id
+        GROUP BY cf.name, cfv.value
+        ORDER BY cf.name, count DESC, cfv.value
+    """).fetchall()
+
+    custom_field_frequencies = {
+        name: [] for (name,) in db.execute("SELECT name FROM custom_field_definitions ORDER BY name").fetchall()
+    }
+    for name, value, count in values:
+        custom_field_frequencies[name].append(ValueCount(value=value, count=count))
+
+    return DatasetAnalytics(
+        version=version,
+        member_count=member_count,
+        age_distribution=[
+            AgeBucket(min_age=int(bucket), max_age=int(bucket) + AGE_BUCKET_YEARS - 1, count=count)
+            for bucket, count in ages
+        ],
+        join_date_histogram=[PeriodCount(period=period, count=count) for period, count in joined],
+        postcode_counts=[PostcodeCount(postcode=postcode, count=count) for postcode, count in postcodes],
+        custom_field_frequencies=custom_field_frequencies,
+    )
@@ -1,27 +1,81 @@
+import hashlib
+import json
 import random
-import requests
-from ollama import chat
 from app.models.member import MemberConfig, Member
 from app.core.config import get_db
-from typing import List, Tuple
+from app.core.writer import run_write
+from app.services.address_pool import take_pooled_addresses, pooled_city_addresses
+from app.services.address_synthesis import synthesize_addresses
+from app.services.members import fetch_members
+from app.services.osm import CityAddresses, fetch_city_addresses
+from app.services.record_cache import member_cache
+from app.services.search import refresh_search_index
+from app.services.uniqueness import registry
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+GENERATION_MODEL = 'llama3.1'
+# Pinned rather than left to the Ollama server default, so a seeded request keeps producing
+# the same members (and the same cache key) even if the server configuration changes.
+GENERATION_TEMPERATURE = 0.8
+# How many times a member whose name is already taken is regenerated before the duplicate name is accepted
+NAME_ATTEMPTS = 3
 
 def generate_members(config: MemberConfig) -> List[Member]:
     """
     Generates fictitious group members using llama3.1 and ollama.
+    If config.seed is set the generation is reproducible: address sampling, member ids and the
+    LLM sampling are all derived from the request, and the result is stored in the generation cache
+    so an identical request is answered from the cache instead of being regenerated (see
+    cached_members). Member ids and LLM seeds are derived from the cache key rather than the seed
+    alone, so requests that only share the seed, or have nearby seeds, generate independent members.
+    Emails and phone numbers already in use are made unique (see UniquenessRegistry), and members
+    with a name already in use are regenerated. This depends on the members already in the database,
+    so a seed reproduces the same members only on a database holding the same members, e.g. an empty one.
     Args:
         config (MemberConfig): Configuration for generating members.
     Returns:
         List[Member]: A list of generated members.
     """
-    
-    addresses_with_coords = get_real_addresses(config.city, config.country, config.count)
+    # ollama and numpy are imported here rather than at module level to keep them out of the API's cold start
+    import numpy as np
+    from ollama import chat
+
+    cache_key = None
+    if config.seed is not None:
+        cache_key = generation_cache_key(config)
+        members = cached_members(cache_key)
+        if members is not None:
+            return members
+
+    rng = random.Random(config.seed)
+    if cache_key is not None:
+        # Seeded from the whole request, so two requests with the same seed do not produce the same ids
+        id_rng = random.Random(int(cache_key, 16))
+    # Only seeded requests sample with rng, unseeded ones may be served from the address pool
+    addresses_with_coords, city_addresses = sample_city_addresses(
+        config.city, config.country, config.count, rng=rng if config.seed is not None else None
+    )
+    if len(addresses_with_coords) < config.count and city_addresses is not None:
+        # Too few real addresses in the city, so make up the rest from the streets that were already fetched
+        addresses_with_coords += synthesize_addresses(
+            city_addresses,
+            config.count - len(addresses_with_coords),
+            config.country,
+            np.random.default_rng(rng.getrandbits(64)),
+        )
+
     db = get_db()
     
     # Get all custom field definitions
     custom_fields = db.execute("SELECT id, name, field_type, validation_rules FROM custom_field_definitions").fetchall()
+    registry.ensure_loaded(db)
     
-    members = []
-    for i in range(config.count):
+    def ask(seed: Optional[int]) -> Member:
+        options = {'temperature': GENERATION_TEMPERATURE}
+        if seed is not None:
+            options['seed'] = seed
+
         response = chat(
             messages=[
                 {
@@ -29,23 +83,158 @@ def generate_members(config: MemberConfig) -> List[Member]:
                     'content': f'Get the data for this ficticious group member from the city of {config.city}, {config.country}. Their age should be between {config.min_age} and {config.max_age} years old. Leave the custom fields empty.',
                 }
             ],
-            model='llama3.1',
+            model=GENERATION_MODEL,
             format=Member.model_json_schema(),
+            options=options,
         )
-        
-        member = Member.model_validate_json(response.message.content)
-        member.custom_fields = None
-        if i < len(addresses_with_coords):
-            address, lat, lon = addresses_with_coords[i]
-            member.address = address
-            member.latitude = lat
-            member.longitude = lon
-            
-        # Insert the member
-        db.execute("""
-            INSERT INTO members 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, [
+        return Member.model_validate_json(response.message.content)
+
+    members = []
+
+    def write(writer_db):
+        if cache_key is not None and writer_db.execute(
+            "SELECT 1 FROM generation_cache WHERE key = ?", [cache_key]
+        ).fetchone():
+            # An identical request generated the same members concurrently and was written first
+            return False
+        insert_members(writer_db, members)
+        if cache_key is not None:
+            writer_db.execute("""
+                INSERT INTO generation_cache (key, members)
+                VALUES (?, ?)
+            """, [cache_key, json.dumps([member.model_dump(mode='json') for member in members])])
+        return True
+
+    try:
+        for i in range(config.count):
+            # Only a member whose name is taken is regenerated, with a different seed on every attempt
+            for attempt in range(NAME_ATTEMPTS):
+                member = ask(member_seed(cache_key, i, attempt) if cache_key is not None else None)
+                if not registry.has_name(member.first_name, member.surname):
+                    break
+            member.email, member.phone_number = registry.claim_member(
+                member.email, member.phone_number, member.first_name, member.surname
+            )
+
+            member.custom_fields = None
+            if config.seed is not None:
+                member.id = UUID(int=id_rng.getrandbits(128), version=4)
+            if i < len(addresses_with_coords):
+                address, lat, lon = addresses_with_coords[i]
+                member.address = address
+                member.latitude = lat
+                member.longitude = lon
+                
+            members.append(member)
+
+        written = run_write(write)
+    except BaseException:
+        # Nothing of this batch was written, so give back what it reserved
+        release_members(members)
+        raise
+    if not written:
+        release_members(members)
+        return cached_members(cache_key)
+    member_cache.invalidate(*[str(member.id) for member in members])
+    
+    return members
+
+def cached_members(cache_key: str) -> Optional[List[Member]]:
+    """
+    Answers a seeded request from the generation cache. Members that still exist are returned as
+    they are now, including later updates. Members deleted since are restored from the cached
+    snapshot, with their email and phone number made unique again like newly generated ones.
+    Args:
+        cache_key (str): The request's generation_cache_key.
+    Returns:
+        Optional[List[Member]]: The members in the order they were generated, or None on a cache miss.
+    """
+    db = get_db()
+    cached = db.execute("SELECT members FROM generation_cache WHERE key = ?", [cache_key]).fetchone()
+    if not cached:
+        return None
+
+    snapshot = [Member.model_validate(m) for m in json.loads(cached[0])]
+    member_ids = [member.id for member in snapshot]
+    existing = fetch_members(db, member_ids)
+    missing = [member for member in snapshot if str(member.id) not in existing]
+
+    restored = []
+    if missing:
+        registry.ensure_loaded(db)
+        for member in missing:
+            member.email, member.phone_number = registry.claim_member(
+                member.email, member.phone_number, member.first_name, member.surname
+            )
+
+        def restore(writer_db):
+            # A concurrent identical request may have restored some of them already
+            present = {str(row[0]) for row in writer_db.execute(
+                "SELECT id FROM members WHERE id IN (SELECT unnest(?::UUID[]))", [[str(m.id) for m in missing]]
+            ).fetchall()}
+            restoring = [member for member in missing if str(member.id) not in present]
+            insert_members(writer_db, restoring)
+            return restoring
+
+        try:
+            restored = run_write(restore)
+        except BaseException:
+            release_members(missing)
+            raise
+        restored_ids = {str(member.id) for member in restored}
+        release_members([member for member in missing if str(member.id) not in restored_ids])
+        member_cache.invalidate(*restored_ids)
+        existing = fetch_members(db, member_ids)
+
+    return [existing[str(member_id)] for member_id in member_ids if str(member_id) in existing]
+
+def release_members(members: List[Member]) -> None:
+    """Gives back the uniqueness claims of generated members that were not written."""
+    for member in members:
+        registry.remove_member((member.email, member.phone_number, member.first_name, member.surname))
+
+def member_seed(cache_key: str, index: int, attempt: int) -> int:
+    """
+    The Ollama seed for one LLM call of a seeded request. It is derived from the whole request, so
+    requests with nearby seeds do not share calls, and a regenerated member does not reuse the seed
+    of another member or request.
+    """
+    digest = hashlib.sha256(f"{cache_key}:{index}:{attempt}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') >> 1
+
+def generation_cache_key(config: MemberConfig) -> str:
+    """
+    Content address of a generation request. Everything that influences the generated members
+    (the config including its seed, the model and the sampling temperature) goes into the key,
+    except the members already in the database, which the uniqueness checks depend on. A cached
+    result is therefore what the request produced on the database it was first made against.
+    Args:
+        config (MemberConfig): Configuration for generating members.
+    Returns:
+        str: Hex encoded SHA-256 digest identifying the request.
+    """
+    payload = json.dumps({
+        'config': config.model_dump(mode='json'),
+        'model': GENERATION_MODEL,
+        'temperature': GENERATION_TEMPERATURE,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def insert_members(db, members: List[Member]) -> None:
+    """
+    Inserts generated members into the members table and indexes them for search.
+    Args:
+        db: An open DuckDB connection.
+        members (List[Member]): The members to insert.
+    """
+    if not members:
+        return
+
+    db.executemany("""
+        INSERT INTO members
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        [
             str(member.id),
             member.date_member_joined_group,
             member.first_name,
@@ -56,88 +245,56 @@ def generate_members(config: MemberConfig) -> List[Member]:
             member.address,
             member.latitude,
             member.longitude
-        ])
-        
-        members.append(member)
-    
-    return members
+        ]
+        for member in members
+    ])
+    refresh_search_index(db, [member.id for member in members])
 
-def get_real_addresses(city: str, country: str, count: int) -> List[Tuple[str, float, float]]:
+def get_real_addresses(city: str, country: str, count: int, rng: Optional[random.Random] = None) -> List[Tuple[str, float, float]]:
     """
     Fetches real addresses with coordinates from OpenStreetMap using Nominatim and Overpass API.
+    Hot cities (see HOT_CITIES) are served from the pre-fetched address pool instead, unless a
+    seeded rng is given, since the pool contents depend on when it was refilled.
     Args:
         city (str): The city to search for.
         country (str): The country to search in.
         count (int): The number of addresses to fetch.
+        rng (Optional[random.Random]): Random generator used to sample the addresses. Pass a seeded
+            generator to get the same addresses for the same OpenStreetMap data.
     Returns:
         List[Tuple[str, float, float]]: A list of tuples containing (address, latitude, longitude).
+            May contain fewer than count addresses.
     """
-    headers = {
-        'User-Agent': 'RealAddressFetcher/1.0 (realaddressfetcher@example.com)'
-    }
-
-    # Step 1: Query Nominatim directly with city and full country name
-    nominatim_url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        'city': city,
-        'country': country,
-        'format': 'json',
-        'limit': 1,
-        'addressdetails': 1,
-        'extratags': 1
-    }
-
-    r = requests.get(nominatim_url, params=params, headers=headers)
-    r.raise_for_status()
-    results = r.json()
-    if not results:
-        raise Exception("City not found.")
-
-    city_data = results[0]
-    bbox = city_data['boundingbox']  # [south, north, west, east]
-    south, north, west, east = bbox
-
-    # Step 2: Get native city name from 'wikipedia' tag
-    native_city_name = city  # fallback
-    wiki_tag = city_data.get("extratags", {}).get("wikipedia")
-    if wiki_tag and ':' in wiki_tag:
-        _, native = wiki_tag.split(':', 1)
-        native_city_name = native.strip()
-
-    # Step 3: Query Overpass using bounding box
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    overpass_query = f"""
-    [out:json][timeout:25];
-    (
-      node["addr:street"]["addr:housenumber"]({south},{west},{north},{east});
-    );
-    out body;
+    addresses, _ = sample_city_addresses(city, country, count, rng=rng)
+    return addresses
+
+def sample_city_addresses(city: str, country: str, count: int,
+                          rng: Optional[random.Random] = None) -> Tuple[List[Tuple[str, float, float]], Optional[CityAddresses]]:
+    """
+    Samples real addresses like get_real_addresses, and also returns everything that was fetched
+    for the city so a shortfall can be synthesized without another request.
+    Returns:
+        Tuple[List[Tuple[str, float, float]], Optional[CityAddresses]]: The sampled addresses and the
+            fetched city data, which is None for a pool whose fetch result is not available
+            and that had enough addresses.
     """
+    if rng is None:
+        pooled = take_pooled_addresses(city, country, count)
+        # An empty pool (e.g. before its first refill) falls back to fetching directly
+        if pooled:
+            city_addresses = pooled_city_addresses(city, country)
+            if len(pooled) < count:
+                # The pool ran low, so top it up with the other real addresses of its last refill
+                # (or of a direct fetch), leaving synthesis for a real shortfall in OpenStreetMap
+                if city_addresses is None:
+                    city_addresses = fetch_city_addresses(city, country)
+                taken = set(pooled)
+                others = [address for address in city_addresses.addresses if address not in taken]
+                random.shuffle(others)
+                pooled += others[:count - len(pooled)]
+            return pooled, city_addresses
 
-    response = requests.post(overpass_url, data=overpass_query, headers=headers)
-    response.raise_for_status()
-    result = response.json()
-
-    nodes = result.get('elements', [])
-    random.shuffle(nodes)
-    address_data = []
-
-    for node in nodes:
-        tags = node.get('tags', {})
-        street = tags.get("addr:street")
-        housenumber = tags.get("addr:housenumber")
-        postcode = tags.get("addr:postcode", "")
-        city_candidate = tags.get("addr:city") or tags.get("addr:town") or tags.get("addr:village")
-
-        if street and housenumber:
-            if city_candidate and native_city_name.lower() in city_candidate.lower():
-                full_address = f"{street} {housenumber}, {postcode}, {city_candidate}, {country}"
-                lat = node.get('lat')
-                lon = node.get('lon')
-                if lat is not None and lon is not None:
-                    address_data.append((full_address, float(lat), float(lon)))
-
-        if len(address_data) >= count:
-            break
-
-    return address_data
+    city_addresses = fetch_city_addresses(city, country)
+    addresses = list(city_addresses.addresses)
+    (rng or random).shuffle(addresses)
+    return addresses[:count], city_addresses
@@ -0,0 +1,59 @@
+import json
+from app.models.member import Member
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+# A member row followed by its custom fields as a JSON object of name -> value
+MEMBER_ROWS_SQL = """
+    SELECT m.*, json_group_object(cf.name, cfv.value) as custom_fields
+    FROM members m
+    LEFT JOIN custom_field_values cfv ON m.id = cfv.member_id
+    LEFT JOIN custom_field_definitions cf ON cfv.field_id = cf.id
+    WHERE {where}
+    GROUP BY m.id, m.date_member_joined_group, m.first_name, m.surname, 
+             m.birthday, m.phone_number, m.email, m.address, m.latitude, m.longitude
+"""
+
+def parse_json_field(field: Any) -> Optional[dict]:
+    """Parse a field that might be a JSON string into a dictionary."""
+    if isinstance(field, str):
+        try:
+            return json.loads(field)
+        except json.JSONDecodeError:
+            return None
+    return field if isinstance(field, dict) else None
+
+def member_from_row(result: tuple) -> Member:
+    """Builds a Member from a members row followed by its custom fields as a JSON object."""
+    custom_fields = parse_json_field(result[10])
+    
+    return Member(
+        id=result[0] if isinstance(result[0], UUID) else UUID(result[0]),
+        date_member_joined_group=result[1],
+        first_name=result[2],
+        surname=result[3],
+        birthday=result[4],
+        phone_number=result[5],
+        email=result[6],
+        address=result[7],
+        latitude=result[8],
+        longitude=result[9],
+        custom_fields=custom_fields if custom_fields != '{}' else None
+    )
+
+def fetch_members(db, member_ids: List[UUID]) -> Dict[str, Member]:
+    """
+    Reads several members with their custom fields in one query.
+    Args:
+        db: An open DuckDB connection.
+        member_ids (List[UUID]): The members to read.
+    Returns:
+        Dict[str, Member]: The members that exist, by str(id).
+    """
+    if not member_ids:
+        return {}
+    rows = db.execute(
+        MEMBER_ROWS_SQL.format(where="m.id IN (SELECT unnest(?::UUID[]))"),
+        [[str(member_id) for member_id in member_ids]],
+    ).fetchall()
+    return {str(row[0]): member_from_row(row) for row in rows}
@@ -0,0 +1,157 @@
+import re
+import threading
+import time
+from app.core import config
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+HEADERS = {
+    'User-Agent': 'RealAddressFetcher/1.0 (realaddressfetcher@example.com)'
+}
+
+class CityAddresses(NamedTuple):
+    """Everything fetched from OpenStreetMap for one city."""
+    # (address, latitude, longitude) of the nodes whose address is in the city
+    addresses: List[Tuple[str, float, float]]
+    # (street, postcode, numeric house number, latitude, longitude) of the addressed nodes in the city,
+    # or of every addressed node in the bounding box if none of them has the city in its address
+    streets: List[Tuple[str, str, int, float, float]]
+    # (south, north, west, east)
+    bbox: Tuple[float, float, float, float]
+    city_name: str
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens are added at `rate` per second up to `capacity`,
+    and acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# Shared by every caller in the process, so request handlers and the address pool
+# scheduler together stay within Nominatim's rate limit.
+nominatim_bucket = TokenBucket(rate=config.NOMINATIM_REQUESTS_PER_SECOND)
+
+def lookup_city(city: str, country: str) -> Dict[str, Any]:
+    """
+    Looks up a city with Nominatim.
+    Args:
+        city (str): The city to search for.
+        country (str): The country to search in.
+    Returns:
+        Dict[str, Any]: The Nominatim search result, including 'boundingbox' and 'extratags'.
+    """
+    # Query Nominatim directly with city and full country name
+    params = {
+        'city': city,
+        'country': country,
+        'format': 'json',
+        'limit': 1,
+        'addressdetails': 1,
+        'extratags': 1
+    }
+
+    import requests
+
+    nominatim_bucket.acquire()
+    r = requests.get(config.NOMINATIM_URL, params=params, headers=HEADERS, timeout=config.OSM_REQUEST_TIMEOUT)
+    r.raise_for_status()
+    results = r.json()
+    if not results:
+        raise Exception("City not found.")
+
+    return results[0]
+
+def fetch_addresses(city_data: Dict[str, Any], city: str, country: str) -> CityAddresses:
+    """
+    Fetches every address with coordinates inside a city's bounding box from the Overpass API.
+    Args:
+        city_data (Dict[str, Any]): The Nominatim result for the city, see lookup_city.
+        city (str): The city name that was searched for.
+        country (str): The country the city is in.
+    Returns:
+        CityAddresses: The addresses in the city, in the order returned by Overpass, along with
+            the streets they are on (see CityAddresses.streets).
+    """
+    bbox = city_data['boundingbox']  # [south, north, west, east]
+    south, north, west, east = bbox
+
+    # Get native city name from 'wikipedia' tag
+    native_city_name = city  # fallback
+    wiki_tag = city_data.get("extratags", {}).get("wikipedia")
+    if wiki_tag and ':' in wiki_tag:
+        _, native = wiki_tag.split(':', 1)
+        native_city_name = native.strip()
+
+    # Query Overpass using bounding box
+    overpass_query = f"""
+    [out:json][timeout:25];
+    (
+      node["addr:street"]["addr:housenumber"]({south},{west},{north},{east});
+    );
+    out body;
+    """
+
+    import requests
+
+    response = requests.post(config.OVERPASS_URL, data=overpass_query, headers=HEADERS, timeout=config.OSM_REQUEST_TIMEOUT)
+    response.raise_for_status()
+    result = response.json()
+
+    address_data = []
+    street_data = []
+    bbox_street_data = []
+    for node in result.get('elements', []):
+        tags = node.get('tags', {})
+        street = tags.get("addr:street")
+        housenumber = tags.get("addr:housenumber")
+        postcode = tags.get("addr:postcode", "")
+        city_candidate = tags.get("addr:city") or tags.get("addr:town") or tags.get("addr:village")
+        lat = node.get('lat')
+        lon = node.get('lon')
+
+        if street and housenumber and lat is not None and lon is not None:
+            number = re.match(r'\d+', housenumber)
+            street_entry = (street, postcode, int(number.group()) if number else 0, float(lat), float(lon))
+            bbox_street_data.append(street_entry)
+
+            if city_candidate and native_city_name.lower() in city_candidate.lower():
+                full_address = f"{street} {housenumber}, {postcode}, {city_candidate}, {country}"
+                address_data.append((full_address, float(lat), float(lon)))
+                street_data.append(street_entry)
+
+    return CityAddresses(
+        addresses=address_data,
+        # Synthesized addresses are labelled with the city, so only fall back to neighbouring
+        # municipalities' streets when no node in the bounding box is tagged with the city
+        streets=street_data or bbox_street_data,
+        bbox=(float(south), float(north), float(west), float(east)),
+        city_name=native_city_name,
+    )
+
+def fetch_city_addresses(city: str, country: str) -> CityAddresses:
+    """
+    Fetches every real address with coordinates in a city from OpenStreetMap using Nominatim and Overpass API.
+    Args:
+        city (str): The city to search for.
+        country (str): The country to search in.
+    Returns:
+        CityAddresses: The addresses in the city, see fetch_addresses.
+    """
+    return fetch_addresses(lookup_city(city, country), city, country)
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from app.core import config
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class LRUCache:
+    """
+    Size-bounded read-through cache that evicts the least recently used entry when full.
+    Entries are filled by the loader passed to get() on a miss, and are never stale: writers invalidate
+    the entries they touch after committing, and a load that overlaps an invalidation is not stored,
+    since it may have read the database before the write committed.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, load: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """
+        Returns the cached value for key, loading and caching it on a miss.
+        Args:
+            key (Hashable): The cache key.
+            load (Callable[[], Optional[Any]]): Reads the value from the database, None if it does not exist.
+        Returns:
+            Optional[Any]: The value, or None if load found nothing (which is not cached).
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            generation = self._generation
+
+        value = load()
+        if value is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[key] = value
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def clear(self) -> None:
+        """Drops all entries and resets the counters."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+# Member rows as returned by DuckDB (with the custom fields as a JSON object), keyed by str(member id)
+member_cache = LRUCache(config.MEMBER_CACHE_SIZE)
+# The custom field definition rows, as a single tuple under CUSTOM_FIELD_CATALOG
+custom_field_cache = LRUCache(1)
+CUSTOM_FIELD_CATALOG = "catalog"
+
+def clear_record_caches() -> None:
+    member_cache.clear()
+    custom_field_cache.clear()
@@ -0,0 +1,143 @@
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+# Member columns that are searchable. Custom field values are indexed under their field id,
+# so renaming a custom field does not touch the index.
+SEARCH_FIELDS = ["first_name", "surname", "email", "address"]
+
+# Minimum trigram similarity for a fuzzy match
+FUZZY_THRESHOLD = 0.3
+
+# Lower-cased runs of letters and digits, e.g. "anna.jensen@example.com" -> anna, jensen, example, com
+_TOKENS_SQL = r"regexp_extract_all(lower({}), '[\pL\pN]+')"
+
+# Trigrams of a token padded like pg_trgm, e.g. "anna" -> "  a", " an", "ann", "nna", "na "
+_TRIGRAMS_SQL = """
+    SELECT DISTINCT {columns}, substr('  ' || {token} || ' ', i, 3) AS trigram
+    FROM (SELECT *, unnest(range(1, length({token}) + 2)) AS i FROM {source})
+"""
+
+def refresh_search_index(db, member_ids: Optional[List[UUID]] = None) -> None:
+    """
+    Brings the search index up to date with the current state of the given members. Members that
+    no longer exist are removed from the index, so this is used after inserts, updates and deletes.
+    Args:
+        db: An open DuckDB connection, normally the write coordinator's.
+        member_ids (Optional[List[UUID]]): The members to re-index, or None to rebuild the whole index.
+    """
+    if member_ids is None:
+        members_filter, values_filter, params = "TRUE", "TRUE", []
+        db.execute("DELETE FROM member_search_trigrams")
+        db.execute("DELETE FROM member_search_tokens")
+    else:
+        if not member_ids:
+            return
+        ids = [str(member_id) for member_id in member_ids]
+        members_filter = "id IN (SELECT unnest(?::UUID[]))"
+        values_filter = "member_id IN (SELECT unnest(?::UUID[]))"
+        params = [ids]
+        db.execute("DELETE FROM member_search_trigrams WHERE member_id IN (SELECT unnest(?::UUID[]))", params)
+        db.execute("DELETE FROM member_search_tokens WHERE member_id IN (SELECT unnest(?::UUID[]))", params)
+
+    field_values = " UNION ALL ".join(
+        [f"SELECT id AS member_id, '{field}' AS field, {field} AS value FROM members WHERE {members_filter}"
+         for field in SEARCH_FIELDS]
+        + [f"SELECT member_id, CAST(field_id AS VARCHAR), value FROM custom_field_values WHERE {values_filter}"]
+    )
+    tokens = f"""
+        (SELECT DISTINCT member_id, field, unnest({_TOKENS_SQL.format('value')}) AS token
+         FROM ({field_values}) WHERE value IS NOT NULL)
+    """
+    db.execute(
+        "INSERT INTO member_search_trigrams "
+        + _TRIGRAMS_SQL.format(columns="member_id, field, token", token="token", source=tokens),
+        params * (len(SEARCH_FIELDS) + 1),
+    )
+
+    trigrams_filter = "TRUE" if member_ids is None else values_filter
+    db.execute(f"""
+        INSERT INTO member_search_tokens
+        SELECT member_id, field, token, count(*) AS trigram_count
+        FROM member_search_trigrams
+        WHERE {trigrams_filter}
+        GROUP BY member_id, field, token
+    """, params)
+
+def index_existing_members(db) -> None:
+    """Indexes the members of a database created before search was added, run once at startup."""
+    index_empty = db.execute("SELECT count(*) FROM member_search_tokens").fetchone()[0] == 0
+    if index_empty and db.execute("SELECT count(*) FROM members").fetchone()[0] > 0:
+        refresh_search_index(db)
+
+def drop_search_field(db, field_id: UUID) -> None:
+    """Removes a deleted custom field's values from the search index."""
+    db.execute("DELETE FROM member_search_trigrams WHERE field = ?", [str(field_id)])
+    db.execute("DELETE FROM member_search_tokens WHERE field = ?", [str(field_id)])
+
+def search_members(db, query: str, field: Optional[str] = None, fuzzy: bool = True,
+                   limit: int = 20, offset: int = 0) -> Tuple[int, List[Tuple[UUID, float]]]:
+    """
+    Searches members through the trigram index. Every word in the query must match a word of the
+    member: exact and prefix matches score between 0.5 and 1 (the closer to the full word the higher),
+    fuzzy matches score half their trigram similarity. A member's score is the sum over the query words.
+    Args:
+        db: An open DuckDB connection.
+        query (str): The search text.
+        field (Optional[str]): Only search this field, a name from SEARCH_FIELDS or a custom field id.
+        fuzzy (bool): Whether to include fuzzy (misspelled) matches.
+        limit (int): Page size.
+        offset (int): Number of results to skip.
+    Returns:
+        Tuple[int, List[Tuple[UUID, float]]]: The total number of matching members, and the ids and
+            scores of the requested page, best match first.
+    """
+    query_trigrams = _TRIGRAMS_SQL.format(
+        columns="qtoken", token="qtoken",
+        source=f"(SELECT DISTINCT unnest({_TOKENS_SQL.format('?')}) AS qtoken)",
+    )
+    result = db.execute(f"""
+        WITH query AS ({query_trigrams}),
+        query_counts AS (
+            SELECT qtoken, count(*) AS qcount FROM query GROUP BY qtoken
+        ),
+        candidates AS (
+            SELECT q.qtoken, t.member_id, t.field, t.token, count(*) AS shared
+            FROM query q
+            JOIN member_search_trigrams t ON t.trigram = q.trigram
+            WHERE ?::VARCHAR IS NULL OR t.field = ?
+            GROUP BY q.qtoken, t.member_id, t.field, t.token
+        ),
+        scored AS (
+            SELECT c.qtoken, c.member_id, max(
+                CASE
+                    WHEN starts_with(c.token, c.qtoken) THEN 0.5 + 0.5 * length(c.qtoken) / length(c.token)
+                    WHEN ? AND c.shared / (qc.qcount + tok.trigram_count - c.shared) >= ?
+                        THEN 0.5 * c.shared / (qc.qcount + tok.trigram_count - c.shared)
+                    ELSE 0
+                END
+            ) AS score
+            FROM candidates c
+            JOIN query_counts qc ON qc.qtoken = c.qtoken
+            JOIN member_search_tokens tok
+                ON tok.member_id = c.member_id AND tok.field = c.field AND tok.token = c.token
+            GROUP BY c.qtoken, c.member_id
+        )
+        SELECT member_id, sum(score) AS score, count(*) OVER () AS total
+        FROM scored
+        WHERE score > 0
+        GROUP BY member_id
+        HAVING count(*) = (SELECT count(*) FROM query_counts)
+        ORDER BY score DESC, member_id
+        LIMIT ? OFFSET ?
+    """, [query, field, field, fuzzy, FUZZY_THRESHOLD, limit, offset]).fetchall()
+
+    if not result:
+        # An empty page past the end still reports how many members matched
+        if offset > 0:
+            total, _ = search_members(db, query, field, fuzzy, limit=1, offset=0)
+            return total, []
+        return 0, []
+    return result[0][2], [
+        (row[0] if isinstance(row[0], UUID) else UUID(row[0]), float(row[1]))
+        for row in result
+    ]
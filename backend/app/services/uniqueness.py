@@ -0,0 +1,211 @@
+import re
+import threading
+from app.core.config import get_db
+from typing import Dict, Optional, Tuple
+
+# Number of trailing digits of a phone number that may be changed to make it unique
+PHONE_SUFFIX_DIGITS = 6
+
+MemberKeys = Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]
+
+class UniquenessRegistry:
+    """
+    Hash sets of the emails, phone numbers and names of all members, loaded once from DuckDB and kept
+    up to date as members are generated, updated and deleted, so checking a generated member is O(1).
+
+    Colliding emails and phone numbers are made unique by changing their suffix: a number is added to
+    the local part of the email, and the trailing digits of the phone number are counted up. A counter
+    per colliding value remembers how far it got, so repeated collisions stay amortized O(1).
+    Values are counted rather than just stored, since members edited by hand may share a value.
+    """
+
+    def __init__(self):
+        self._emails: Dict[str, int] = {}
+        self._phones: Dict[str, int] = {}
+        self._names: Dict[Tuple[str, str], int] = {}
+        self._email_suffixes: Dict[str, int] = {}
+        self._phone_suffixes: Dict[str, int] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+        # Number of candidate values checked, to show that claims stay O(1)
+        self.probes = 0
+
+    def ensure_loaded(self, db=None) -> None:
+        """Loads the existing members' values from DuckDB on first use."""
+        with self._lock:
+            if self._loaded:
+                return
+            db = db or get_db()
+            for email, phone, first_name, surname in db.execute(
+                "SELECT email, phone_number, first_name, surname FROM members"
+            ).fetchall():
+                self._add((email, phone, first_name, surname))
+            self._loaded = True
+
+    def clear(self) -> None:
+        """Forgets everything, the next ensure_loaded() reloads from the database."""
+        with self._lock:
+            self._emails.clear()
+            self._phones.clear()
+            self._names.clear()
+            self._email_suffixes.clear()
+            self._phone_suffixes.clear()
+            self._loaded = False
+            self.probes = 0
+
+    def has_name(self, first_name: str, surname: str) -> bool:
+        with self._lock:
+            return _name_key(first_name, surname) in self._names
+
+    def claim_email(self, email: str) -> str:
+        """
+        Reserves an email address, changing it if it is already in use.
+        Returns:
+            str: The email, or e.g. "anna.jensen2@example.com" if "anna.jensen@example.com" was taken.
+        """
+        with self._lock:
+            self.probes += 1
+            key = _email_key(email)
+            if key not in self._emails:
+                self._emails[key] = 1
+                return email
+
+            local, at, domain = email.rpartition('@')
+            if not at:
+                local, domain = email, ''
+            suffix = self._email_suffixes.get(key, 1)
+            while True:
+                suffix += 1
+                candidate = f"{local}{suffix}{at}{domain}"
+                self.probes += 1
+                if _email_key(candidate) not in self._emails:
+                    break
+            self._email_suffixes[key] = suffix
+            self._emails[_email_key(candidate)] = 1
+            return candidate
+
+    def claim_phone(self, phone: str) -> str:
+        """
+        Reserves a phone number, changing its trailing digits if it is already in use.
+        The formatting and the leading digits (country and area code) are kept.
+        Returns:
+            str: The phone number, or e.g. "+45 12 34 56 79" if "+45 12 34 56 78" was taken.
+        """
+        with self._lock:
+            self.probes += 1
+            key = _phone_key(phone)
+            if key not in self._phones:
+                self._phones[key] = 1
+                return phone
+
+            if not key:
+                # Nothing to count up, so append digits instead
+                phone, key = f"{phone} 0", '0'
+            width = min(len(key), PHONE_SUFFIX_DIGITS)
+            # The number with its last digits replaced by placeholders, e.g. "+45 12 {}{} {}{} {}{}"
+            template, remaining = [], width
+            for c in reversed(phone):
+                if c.isdigit() and remaining:
+                    template.append('{}')
+                    remaining -= 1
+                else:
+                    template.append(c.replace('{', '{{').replace('}', '}}'))
+            template = ''.join(reversed(template))
+            key_prefix, value, modulus = key[:-width], int(key[-width:]), 10 ** width
+
+            offset = self._phone_suffixes.get(key, 0)
+            while True:
+                offset += 1
+                if offset >= modulus:
+                    raise ValueError(f"No unique phone number left for {phone}")
+                digits = str((value + offset) % modulus).zfill(width)
+                self.probes += 1
+                if key_prefix + digits not in self._phones:
+                    break
+            self._phone_suffixes[key] = offset
+            self._phones[key_prefix + digits] = 1
+            return template.format(*digits)
+
+    def claim_member(self, email: str, phone: str, first_name: str, surname: str) -> Tuple[str, str]:
+        """
+        Reserves the values of a generated member, see claim_email and claim_phone.
+        Nothing is reserved if it fails.
+        Returns:
+            Tuple[str, str]: The unique email and phone number.
+        """
+        with self._lock:
+            email = self.claim_email(email)
+            try:
+                phone = self.claim_phone(phone)
+            except Exception:
+                _decrement(self._emails, _email_key(email))
+                raise
+            self.add_name(first_name, surname)
+            return email, phone
+
+    def add_name(self, first_name: str, surname: str) -> None:
+        with self._lock:
+            _increment(self._names, _name_key(first_name, surname))
+
+    def add_member(self, keys: MemberKeys) -> None:
+        """Registers the values of a member as they are, without making them unique."""
+        with self._lock:
+            if self._loaded:
+                self._add(keys)
+
+    def remove_member(self, keys: MemberKeys) -> None:
+        """Releases the values of a deleted member, or of a generated one that was never written."""
+        with self._lock:
+            if self._loaded:
+                email, phone, first_name, surname = keys
+                if email:
+                    _decrement(self._emails, _email_key(email))
+                if phone:
+                    _decrement(self._phones, _phone_key(phone))
+                if first_name is not None and surname is not None:
+                    _decrement(self._names, _name_key(first_name, surname))
+
+    def update_member(self, old: MemberKeys, new: MemberKeys) -> None:
+        """Replaces the values of an updated member."""
+        with self._lock:
+            self.remove_member(old)
+            self.add_member(new)
+
+    def _add(self, keys: MemberKeys) -> None:
+        email, phone, first_name, surname = keys
+        if email:
+            _increment(self._emails, _email_key(email))
+        if phone:
+            _increment(self._phones, _phone_key(phone))
+        if first_name is not None and surname is not None:
+            _increment(self._names, _name_key(first_name, surname))
+
+def member_keys(db, member_id) -> Optional[MemberKeys]:
+    """
+    Reads the values of a member that the registry keeps track of.
+    Returns:
+        Optional[MemberKeys]: (email, phone_number, first_name, surname), or None if there is no such member.
+    """
+    return db.execute(
+        "SELECT email, phone_number, first_name, surname FROM members WHERE id = ?", [str(member_id)]
+    ).fetchone()
+
+def _email_key(email: str) -> str:
+    return email.strip().lower()
+
+def _phone_key(phone: str) -> str:
+    return re.sub(r'\D', '', phone)
+
+def _name_key(first_name: str, surname: str) -> Tuple[str, str]:
+    return first_name.strip().lower(), surname.strip().lower()
+
+def _increment(counts: Dict, key) -> None:
+    counts[key] = counts.get(key, 0) + 1
+
+def _decrement(counts: Dict, key) -> None:
+    if counts.get(key, 0) > 1:
+        counts[key] -= 1
+    else:
+        counts.pop(key, None)
+
+registry = UniquenessRegistry()
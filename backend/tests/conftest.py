@@ -0,0 +1,42 @@
+from app.core.config import get_db, TEST_DB_PATH
+from app.services.analytics import clear_analytics_cache
+from app.services.record_cache import clear_record_caches
+from app.services.uniqueness import registry
+import gc
+import pytest
+import os
+
+@pytest.fixture(autouse=True)
+def test_db():
+    try:
+        # Connections kept alive by exception tracebacks would otherwise keep the previous
+        # test's database open, and DuckDB would hand it out again instead of a new file
+        gc.collect()
+        if TEST_DB_PATH.exists():
+            TEST_DB_PATH.unlink()
+        clear_analytics_cache()
+        registry.clear()
+        clear_record_caches()
+
+        os.environ["TESTING"] = "1"
+        
+        db = get_db()
+        
+        yield db
+
+    finally:
+        if 'db' in locals():
+            db.close()
+        
+        if TEST_DB_PATH.exists():
+            TEST_DB_PATH.unlink()
+        
+        if "TESTING" in os.environ:
+            del os.environ["TESTING"]
+
+def insert_member(db, member_id, email="anna@example.com", phone="+45 11111111", first_name="Anna", surname="Jensen"):
+    """Inserts a member row directly, e.g. from a writer job, without generating it."""
+    db.execute("""
+        INSERT INTO members
+        VALUES (?, '2020-01-01', ?, ?, '1990-01-01', ?, ?, 'Annavej 1', NULL, NULL)
+    """, [member_id, first_name, surname, phone, email])
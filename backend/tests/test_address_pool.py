@@ -0,0 +1,213 @@
+from app.core import config
+from app.services import address_pool, generator, osm
+from app.services.address_pool import AddressPoolScheduler, parse_hot_cities
+from app.models.member import MemberConfig
+from app.services.generator import generate_members, get_real_addresses, sample_city_addresses
+from app.services.osm import TokenBucket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+import json
+import ollama
+import random
+import threading
+import time
+import pytest
+
+NODE_COUNT = 200
+
+class StubOSMHandler(BaseHTTPRequestHandler):
+    """Serves a fixed city from /search (Nominatim) and its addresses from /interpreter (Overpass)."""
+
+    def do_GET(self):
+        self.server.requests.append("nominatim")
+        self.send_json([{
+            "boundingbox": ["55.6", "55.8", "12.4", "12.7"],
+            "extratags": {"wikipedia": "da:Stubby"},
+        }])
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append("overpass")
+        self.send_json({"elements": [
+            {
+                "lat": 55.7 + i * 1e-5,
+                "lon": 12.5 + i * 1e-5,
+                "tags": {
+                    "addr:street": "Stubvej",
+                    "addr:housenumber": str(i + 1),
+                    "addr:postcode": "1000",
+                    "addr:city": "Stubby",
+                },
+            }
+            for i in range(NODE_COUNT)
+        ]})
+
+    def send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_osm(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOSMHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(config, "NOMINATIM_URL", f"{base_url}/search")
+    monkeypatch.setattr(config, "OVERPASS_URL", f"{base_url}/interpreter")
+    monkeypatch.setattr(osm, "nominatim_bucket", TokenBucket(rate=1000))
+    try:
+        yield server
+    finally:
+        address_pool.stop_address_pool()
+        server.shutdown()
+        server.server_close()
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+def test_parse_hot_cities():
+    assert parse_hot_cities("København:Danmark; Aarhus : Danmark;invalid;") == [
+        ("København", "Danmark"),
+        ("Aarhus", "Danmark"),
+    ]
+    assert parse_hot_cities("") == []
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # The first token is available immediately, the remaining four arrive at 20 per second
+    assert time.monotonic() - start >= 0.19
+
+def test_pool_refill_and_take(stub_osm):
+    scheduler = AddressPoolScheduler([("Stubby", "Stubland")], size=50, low_watermark=10, refill_interval=60)
+    scheduler.refill()
+
+    assert len(scheduler.pools[("stubby", "stubland")]) == 50
+    assert stub_osm.requests == ["nominatim", "overpass"]
+
+    addresses = scheduler.take("stubby", "STUBLAND", 20)
+    assert len(addresses) == 20
+    assert len(set(addresses)) == 20
+    assert all("Stubby, Stubland" in address for address, _, _ in addresses)
+    assert scheduler.take("Elsewhere", "Stubland", 20) is None
+
+    # Refilling above the watermark is a no-op, below it only Overpass is queried again
+    scheduler.refill()
+    assert stub_osm.requests == ["nominatim", "overpass"]
+    scheduler.take("Stubby", "Stubland", 25)
+    scheduler.refill()
+    assert stub_osm.requests == ["nominatim", "overpass", "overpass"]
+    assert len(scheduler.pools[("stubby", "stubland")]) == 50
+
+def test_background_refill_below_watermark(stub_osm):
+    scheduler = address_pool.start_address_pool([("Stubby", "Stubland")], size=50, low_watermark=10, refill_interval=60)
+    pool = scheduler.pools[("stubby", "stubland")]
+    wait_for(lambda: len(pool) == 50)
+
+    addresses = get_real_addresses("Stubby", "Stubland", 45)
+    assert len(addresses) == 45
+    wait_for(lambda: len(pool) == 50)
+    assert stub_osm.requests == ["nominatim", "overpass", "overpass"]
+
+def test_seeded_request_bypasses_pool(stub_osm):
+    scheduler = address_pool.start_address_pool([("Stubby", "Stubland")], size=50, low_watermark=10, refill_interval=60)
+    pool = scheduler.pools[("stubby", "stubland")]
+    wait_for(lambda: len(pool) == 50)
+
+    first = get_real_addresses("Stubby", "Stubland", 5, rng=random.Random(3))
+    second = get_real_addresses("Stubby", "Stubland", 5, rng=random.Random(3))
+    assert first == second
+    assert len(pool) == 50
+
+def test_short_pool_is_topped_up_from_last_refill(stub_osm):
+    scheduler = address_pool.start_address_pool([("Stubby", "Stubland")], size=50, low_watermark=10, refill_interval=60)
+    pool = scheduler.pools[("stubby", "stubland")]
+    wait_for(lambda: len(pool) == 50)
+
+    addresses, city_addresses = sample_city_addresses("Stubby", "Stubland", 60)
+    assert len(set(addresses)) == 60
+    assert set(addresses) <= set(city_addresses.addresses)
+    assert len(city_addresses.streets) == NODE_COUNT
+    assert stub_osm.requests[:2] == ["nominatim", "overpass"]
+
+def test_generate_does_not_synthesize_for_drained_pool(stub_osm, monkeypatch):
+    content = json.dumps({
+        "date_member_joined_group": "2020-01-01",
+        "first_name": "Anna",
+        "surname": "Jensen",
+        "birthday": "1990-01-01",
+        "phone_number": "+45 12345678",
+        "email": "anna@example.com",
+        "address": "Invented street 1",
+    })
+    monkeypatch.setattr(ollama, "chat", lambda **kwargs: SimpleNamespace(message=SimpleNamespace(content=content)))
+    monkeypatch.setattr(generator, "synthesize_addresses", lambda *args: pytest.fail("real addresses were left"))
+    scheduler = address_pool.start_address_pool([("Stubby", "Stubland")], size=10, low_watermark=5, refill_interval=60)
+    pool = scheduler.pools[("stubby", "stubland")]
+    wait_for(lambda: len(pool) == 10)
+
+    members = generate_members(MemberConfig(city="Stubby", country="Stubland", count=30))
+    real = {address for address, _, _ in pool.city_addresses.addresses}
+    assert len({member.address for member in members}) == 30
+    assert {member.address for member in members} <= real
+
+def test_generate_takes_unseeded_addresses_from_pool(stub_osm, monkeypatch):
+    content = json.dumps({
+        "date_member_joined_group": "2020-01-01",
+        "first_name": "Anna",
+        "surname": "Jensen",
+        "birthday": "1990-01-01",
+        "phone_number": "+45 12345678",
+        "email": "anna@example.com",
+        "address": "Invented street 1",
+    })
+    monkeypatch.setattr(ollama, "chat", lambda **kwargs: SimpleNamespace(message=SimpleNamespace(content=content)))
+    scheduler = address_pool.start_address_pool([("Stubby", "Stubland")], size=50, low_watermark=10, refill_interval=60)
+    pool = scheduler.pools[("stubby", "stubland")]
+    wait_for(lambda: len(pool) == 50)
+    fetches = len(stub_osm.requests)
+
+    generate_members(MemberConfig(city="Stubby", country="Stubland", count=5))
+    assert len(pool) == 45
+    assert len(stub_osm.requests) == fetches
+
+class HangingOSMHandler(BaseHTTPRequestHandler):
+    """Accepts requests and never answers them, like an overloaded Overpass server."""
+
+    def do_GET(self):
+        time.sleep(10)
+
+    def log_message(self, format, *args):
+        pass
+
+def test_stop_is_not_blocked_by_hanging_request(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), HangingOSMHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(config, "NOMINATIM_URL", f"http://127.0.0.1:{server.server_port}/search")
+    monkeypatch.setattr(config, "OSM_REQUEST_TIMEOUT", 0.5)
+    monkeypatch.setattr(osm, "nominatim_bucket", TokenBucket(rate=1000))
+    try:
+        scheduler = address_pool.start_address_pool([("Stubby", "Stubland")], size=50, low_watermark=10, refill_interval=60)
+        time.sleep(0.1)
+        start = time.monotonic()
+        scheduler.stop()
+        assert time.monotonic() - start < 2
+    finally:
+        server.shutdown()
+        server.server_close()
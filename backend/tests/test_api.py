@@ -1,34 +1,81 @@
 from fastapi.testclient import TestClient
 from app.main import app
-from app.core.config import get_db, TEST_DB_PATH
 import pytest
 import os
-from app.services.generator import get_real_addresses
+import json
+import random
+import subprocess
+import sys
+import threading
+import ollama
+import requests
+from types import SimpleNamespace
+from datetime import date
+from app.services import osm
+from app.services.generator import NAME_ATTEMPTS, get_real_addresses
+from app.services.address_synthesis import synthesize_addresses
+from app.services.osm import CityAddresses
+from app.services import analytics
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4
 
 client = TestClient(app)
 
-@pytest.fixture(autouse=True)
-def test_db():
-    try:
-        if TEST_DB_PATH.exists():
-            TEST_DB_PATH.unlink()
-
-        os.environ["TESTING"] = "1"
-        
-        db = get_db()
-        
-        yield db
-
-    finally:
-        if 'db' in locals():
-            db.close()
-        
-        if TEST_DB_PATH.exists():
-            TEST_DB_PATH.unlink()
-        
-        if "TESTING" in os.environ:
-            del os.environ["TESTING"]
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+def fake_osm_nodes(count=50):
+    return [
+        {
+            "lat": 55.68 + i * 1e-4,
+            "lon": 12.57 + i * 1e-4,
+            "tags": {
+                "addr:street": f"Testvej {i % 5}",
+                "addr:housenumber": str(i + 1),
+                "addr:postcode": f"{2100 + i % 3}",
+                "addr:city": "København",
+            },
+        }
+        for i in range(count)
+    ]
+
+@pytest.fixture
+def fake_osm(monkeypatch):
+    """Replaces Nominatim and Overpass with canned responses for København."""
+    city = {"boundingbox": ["55.6", "55.8", "12.4", "12.7"], "extratags": {"wikipedia": "da:København"}}
+    monkeypatch.setattr(requests, "get", lambda *args, **kwargs: FakeResponse([city]))
+    monkeypatch.setattr(requests, "post", lambda *args, **kwargs: FakeResponse({"elements": fake_osm_nodes()}))
+    monkeypatch.setattr(osm, "nominatim_bucket", osm.TokenBucket(rate=1000))
+
+@pytest.fixture
+def fake_ollama(monkeypatch):
+    """Replaces the Ollama chat call and records the options of every call."""
+    calls = []
+
+    def fake_chat(messages, model, format, options=None):
+        calls.append(options)
+        seed = (options or {}).get("seed", random.randrange(1_000_000))
+        content = json.dumps({
+            "date_member_joined_group": "2020-01-01",
+            "first_name": f"Test{seed}",
+            "surname": "Person",
+            "birthday": "1990-01-01",
+            "phone_number": f"+45 {seed:08d}",
+            "email": f"test{seed}@example.com",
+            "address": "Invented street 1",
+        })
+        return SimpleNamespace(message=SimpleNamespace(content=content))
+
+    monkeypatch.setattr(ollama, "chat", fake_chat)
+    return calls
 
 def test_generate_members(test_db):
     response = client.post("/generate", json={
@@ -142,6 +189,344 @@ def test_get_real_addresses():
         assert "københavn" in address[0].lower()
         assert "danmark" in address[0].lower()
 
+def test_get_real_addresses_seeded(fake_osm):
+    first = get_real_addresses("København", "Danmark", 10, rng=random.Random(42))
+    second = get_real_addresses("København", "Danmark", 10, rng=random.Random(42))
+    other = get_real_addresses("København", "Danmark", 10, rng=random.Random(43))
+
+    assert len(first) == 10
+    assert first == second
+    assert first != other
+
+def test_generate_members_seeded_is_cached(test_db, fake_osm, fake_ollama):
+    config = {
+        "city": "København",
+        "country": "Danmark",
+        "count": 3,
+        "seed": 7
+    }
+
+    first = client.post("/generate", json=config)
+    assert first.status_code == 200
+    assert len({call["seed"] for call in fake_ollama}) == 3
+
+    second = client.post("/generate", json=config)
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert len(fake_ollama) == 3
+
+    response = client.get("/members")
+    assert len(response.json()) == 3
+
+def test_generate_members_seeded_cache_restores_deleted(test_db, fake_osm, fake_ollama):
+    config = {"city": "København", "country": "Danmark", "count": 2, "seed": 1}
+    members = client.post("/generate", json=config).json()
+
+    client.delete(f"/members/{members[0]['id']}")
+    assert client.post("/generate", json=config).json() == members
+    assert client.get(f"/members/{members[0]['id']}").status_code == 200
+
+def test_generate_members_same_seed_different_config(test_db, fake_osm, fake_ollama):
+    first = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 2, "seed": 7})
+    second = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 2, "seed": 7, "min_age": 20})
+    assert first.status_code == second.status_code == 200
+    assert not {m["id"] for m in first.json()} & {m["id"] for m in second.json()}
+    assert len(client.get("/members").json()) == 4
+
+def test_generate_members_unseeded_is_not_cached(test_db, fake_osm, fake_ollama):
+    config = {"city": "København", "country": "Danmark", "count": 1}
+    client.post("/generate", json=config)
+    client.post("/generate", json=config)
+
+    assert len(fake_ollama) == 2
+    assert all("seed" not in call for call in fake_ollama)
+
+def test_generate_members_nearby_seeds_are_independent(test_db, fake_osm, fake_ollama):
+    first = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 5, "seed": 100}).json()
+    second = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 5, "seed": 101}).json()
+
+    # No LLM call is shared between the requests, so no member had to be regenerated
+    assert len(fake_ollama) == 10
+    assert len({call["seed"] for call in fake_ollama}) == 10
+    members = first + second
+    assert len({(m["first_name"], m["surname"]) for m in members}) == 10
+    assert len({m["email"] for m in members}) == 10
+
+def test_generate_members_concurrent_identical_seeded_requests(test_db, fake_osm, fake_ollama, monkeypatch):
+    # Both requests generate at the same time, so both miss the generation cache
+    barrier = threading.Barrier(2, timeout=5)
+    waited = threading.local()
+    fake_chat = ollama.chat
+
+    def chat(**kwargs):
+        if not getattr(waited, "done", False):
+            waited.done = True
+            barrier.wait()
+        return fake_chat(**kwargs)
+    monkeypatch.setattr(ollama, "chat", chat)
+
+    config = {"city": "København", "country": "Danmark", "count": 3, "seed": 9}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        responses = list(pool.map(lambda _: client.post("/generate", json=config), range(2)))
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].json() == responses[1].json()
+    assert len(client.get("/members").json()) == 3
+
+def test_generate_members_seeded_cache_returns_current_members(test_db, fake_osm, fake_ollama, monkeypatch):
+    config = {"city": "København", "country": "Danmark", "count": 2, "seed": 2}
+    first, second = client.post("/generate", json=config).json()
+    client.patch(f"/members/{first['id']}", json={"first_name": "Mette"})
+    client.delete(f"/members/{second['id']}")
+
+    # Someone else takes the deleted member's email in the meantime
+    content = json.dumps({**second, "id": str(uuid4()), "first_name": "Other"})
+    monkeypatch.setattr(ollama, "chat", lambda **kwargs: SimpleNamespace(message=SimpleNamespace(content=content)))
+    client.post("/generate", json={"city": "København", "country": "Danmark", "count": 1})
+
+    patched, restored = client.post("/generate", json=config).json()
+    assert patched == client.get(f"/members/{first['id']}").json()
+    assert patched["first_name"] == "Mette"
+    assert restored["id"] == second["id"]
+    assert restored["email"] != second["email"]
+    assert restored == client.get(f"/members/{second['id']}").json()
+
+def test_generated_emails_and_phones_are_made_unique(test_db, fake_osm, monkeypatch):
+    content = json.dumps({
+        "date_member_joined_group": "2020-01-01",
+        "first_name": "Anna",
+        "surname": "Jensen",
+        "birthday": "1990-01-01",
+        "phone_number": "+45 12 34 56 78",
+        "email": "anna@example.com",
+        "address": "Invented street 1",
+    })
+    calls = []
+    monkeypatch.setattr(ollama, "chat", lambda **kwargs: calls.append(kwargs) or SimpleNamespace(message=SimpleNamespace(content=content)))
+
+    members = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 3}).json()
+    # Each member after the first is regenerated for its taken name, the names stay taken
+    assert len(calls) == 1 + 2 * NAME_ATTEMPTS
+    assert [m["email"] for m in members] == ["anna@example.com", "anna2@example.com", "anna3@example.com"]
+    assert [m["phone_number"] for m in members] == ["+45 12 34 56 78", "+45 12 34 56 79", "+45 12 34 56 80"]
+
+def test_failed_generation_releases_claims(test_db, fake_osm, monkeypatch):
+    from app.services.uniqueness import registry
+    calls = []
+
+    def flaky_chat(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 3:
+            raise ConnectionError("ollama went away")
+        content = json.dumps({
+            "date_member_joined_group": "2020-01-01",
+            "first_name": f"Anna{len(calls)}",
+            "surname": "Jensen",
+            "birthday": "1990-01-01",
+            "phone_number": "+45 12 34 56 78",
+            "email": "anna@example.com",
+            "address": "Invented street 1",
+        })
+        return SimpleNamespace(message=SimpleNamespace(content=content))
+    monkeypatch.setattr(ollama, "chat", flaky_chat)
+
+    with pytest.raises(ConnectionError):
+        client.post("/generate", json={"city": "København", "country": "Danmark", "count": 3})
+    assert not registry.has_name("Anna1", "Jensen")
+    # The values reserved by the failed batch are free again, so no suffix is needed
+    members = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 1}).json()
+    assert members[0]["email"] == "anna@example.com"
+    assert members[0]["phone_number"] == "+45 12 34 56 78"
+
+def test_synthesize_addresses():
+    city_addresses = CityAddresses(
+        addresses=[],
+        streets=[("Testvej", "2100", 10, 55.70, 12.50), ("Prøvegade", "2200", 4, 55.79, 12.69)],
+        bbox=(55.6, 55.8, 12.4, 12.7),
+        city_name="København",
+    )
+
+    addresses = synthesize_addresses(city_addresses, 500, "Danmark", np.random.default_rng(1))
+    assert len(addresses) == 500
+    assert addresses == synthesize_addresses(city_addresses, 500, "Danmark", np.random.default_rng(1))
+    for address, lat, lon in addresses:
+        street, number, postcode, city, country = address.replace(",", "").rsplit(" ", 4)
+        assert (street, postcode) in {("Testvej", "2100"), ("Prøvegade", "2200")}
+        assert 1 <= int(number) <= (10 if street == "Testvej" else 4)
+        assert (city, country) == ("København", "Danmark")
+        assert 55.6 <= lat <= 55.8
+        assert 12.4 <= lon <= 12.7
+
+    empty = city_addresses._replace(streets=[])
+    assert synthesize_addresses(empty, 5, "Danmark", np.random.default_rng(1)) == []
+
+def test_generate_members_fills_address_shortfall(test_db, fake_osm, fake_ollama, monkeypatch):
+    nodes = fake_osm_nodes(20)
+    for node in nodes[2:]:
+        node["tags"]["addr:city"] = "Frederiksberg"
+    monkeypatch.setattr(requests, "post", lambda *args, **kwargs: FakeResponse({"elements": nodes}))
+
+    response = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 6, "seed": 3})
+    assert response.status_code == 200
+    members = response.json()
+    assert len(members) == 6
+    assert all(member["latitude"] is not None and member["longitude"] is not None for member in members)
+    for member in members:
+        street, number, postcode, city, country = member["address"].replace(",", "").rsplit(" ", 4)
+        # Only streets of nodes in the city itself, not those of Frederiksberg inside the bounding box
+        assert (street, postcode) in {("Testvej 0", "2100"), ("Testvej 1", "2101")}
+        assert (city, country) == ("København", "Danmark")
+
+def test_fetch_addresses_falls_back_to_bounding_box(fake_osm, monkeypatch):
+    nodes = fake_osm_nodes(20)
+    for node in nodes:
+        node["tags"]["addr:city"] = "Frederiksberg"
+    monkeypatch.setattr(requests, "post", lambda *args, **kwargs: FakeResponse({"elements": nodes}))
+
+    city_addresses = osm.fetch_city_addresses("København", "Danmark")
+    assert city_addresses.addresses == []
+    assert len(city_addresses.streets) == 20
+
+def test_heavy_modules_are_imported_lazily():
+    heavy = ["ollama", "pandas", "openpyxl", "requests", "numpy"]
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, app.main; print([m for m in {heavy!r} if m in sys.modules])"],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.dirname(__file__)),
+    )
+    assert result.stdout.strip() == "[]"
+
+def test_readiness(test_db):
+    with TestClient(app) as started_client:
+        response = started_client.get("/ready")
+        assert response.status_code == 200
+        status = response.json()
+        assert status["ready"] is True
+        assert 0 < status["import_seconds"] <= status["startup_seconds"]
+
+def search(**params):
+    response = client.get("/members/search", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+def search_names(**params):
+    return sorted(hit["member"]["first_name"] for hit in search(**params)["results"])
+
+def test_search_members(test_db, fake_osm, fake_ollama):
+    members = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 3}).json()
+    annelise, anders, mette = [member["id"] for member in members]
+    client.patch(f"/members/{annelise}", json={"first_name": "Annelise", "surname": "Jensen"})
+    client.patch(f"/members/{anders}", json={"first_name": "Anders", "surname": "Hansen"})
+    client.patch(f"/members/{mette}", json={"first_name": "Mette", "surname": "Jensen", "email": "mette@example.dk"})
+
+    assert search_names(q="Jensen") == ["Annelise", "Mette"]
+    assert search_names(q="ann") == ["Annelise"]
+    assert search_names(q="an") == ["Anders", "Annelise"]
+    assert search_names(q="jensn") == ["Annelise", "Mette"]
+    assert search_names(q="jensn", fuzzy=False) == []
+    assert search_names(q="annelise jensen") == ["Annelise"]
+    assert search_names(q="mette", field="email") == ["Mette"]
+    assert search_names(q="mette", field="surname") == []
+
+    # Exact matches rank above prefix matches, which rank above fuzzy ones
+    hits = search(q="anders")["results"]
+    assert hits[0]["member"]["first_name"] == "Anders"
+    assert search(q="hanse")["results"][0]["score"] > search(q="hamsen")["results"][0]["score"]
+
+    assert client.get("/members/search", params={"q": "x", "field": "nope"}).status_code == 400
+
+def test_search_members_pagination(test_db, fake_osm, fake_ollama):
+    members = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 5}).json()
+    for member in members:
+        client.patch(f"/members/{member['id']}", json={"surname": "Jensen"})
+
+    first_page = search(q="jensen", limit=2)
+    second_page = search(q="jensen", limit=2, offset=2)
+    assert first_page["total"] == second_page["total"] == 5
+    assert len(first_page["results"]) == len(second_page["results"]) == 2
+    assert {hit["member"]["id"] for hit in first_page["results"]}.isdisjoint(
+        hit["member"]["id"] for hit in second_page["results"]
+    )
+    assert search(q="jensen", limit=2, offset=10) == {"total": 5, "limit": 2, "offset": 10, "results": []}
+
+def test_search_members_fetches_page_in_one_query(test_db, fake_osm, fake_ollama, monkeypatch):
+    from app.api import routes
+    client.post("/generate", json={"city": "København", "country": "Danmark", "count": 5})
+    client.post("/custom-fields", json={"name": "level", "field_type": "string", "validation_rules": {}})
+    monkeypatch.setattr(routes, "get_member", lambda member_id: pytest.fail("search should not load members one by one"))
+
+    results = search(q="person", limit=3)
+    assert results["total"] == 5
+    assert len(results["results"]) == 3
+    assert all(hit["member"]["custom_fields"] == {"level": ""} for hit in results["results"])
+
+def test_existing_members_are_indexed_at_startup(test_db):
+    test_db.execute("""
+        INSERT INTO members
+        VALUES (gen_random_uuid(), '2020-01-01', 'Mette', 'Jensen', '1990-01-01', '+45 11111111', 'mette@example.com', 'Mettevej 1', NULL, NULL)
+    """)
+    assert search_names(q="mette") == []
+
+    with TestClient(app) as started:
+        assert started.get("/members/search", params={"q": "mette"}).json()["total"] == 1
+
+def test_search_index_follows_writes(test_db, fake_osm, fake_ollama):
+    member = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 1}).json()[0]
+    field_id = client.post("/custom-fields", json={"name": "level", "field_type": "string", "validation_rules": {}}).json()["id"]
+    client.patch(f"/members/{member['id']}", json={"first_name": "Mette", "custom_fields": {"level": "gold"}})
+
+    assert search_names(q="gold", field="level") == ["Mette"]
+    client.patch(f"/custom-fields/{field_id}", json={"name": "tier"})
+    assert search_names(q="gold", field="tier") == ["Mette"]
+
+    client.patch(f"/members/{member['id']}", json={"first_name": "Sofie"})
+    assert search_names(q="mette") == []
+    assert search_names(q="sofie") == ["Sofie"]
+
+    client.delete(f"/custom-fields/{field_id}")
+    assert search_names(q="gold") == []
+
+    client.delete(f"/members/{member['id']}")
+    assert search_names(q="sofie") == []
+
+def test_dataset_analytics(test_db, fake_osm, fake_ollama, monkeypatch):
+    members = client.post("/generate", json={"city": "København", "country": "Danmark", "count": 3, "seed": 5}).json()
+    client.post("/custom-fields", json={"name": "level", "field_type": "string", "validation_rules": {}})
+    this_year = date.today().year
+    birthdays = [f"{this_year - 33}-01-01", f"{this_year - 35}-06-01", f"{this_year - 65}-03-01"]
+    for member, birthday, level in zip(members, birthdays, ["gold", "gold", "silver"]):
+        client.patch(f"/members/{member['id']}", json={"birthday": birthday, "custom_fields": {"level": level}})
+    client.patch(f"/members/{members[2]['id']}", json={"date_member_joined_group": "2021-05-17"})
+
+    computed = []
+    compute_analytics = analytics.compute_analytics
+    monkeypatch.setattr(analytics, "compute_analytics", lambda *args: computed.append(args) or compute_analytics(*args))
+
+    response = client.get("/analytics")
+    assert response.status_code == 200
+    result = response.json()
+    assert result["member_count"] == 3
+    assert sum(bucket["count"] for bucket in result["age_distribution"]) == 3
+    assert [bucket["count"] for bucket in result["age_distribution"] if bucket["min_age"] <= 30 <= bucket["max_age"]] == [2]
+    assert result["join_date_histogram"] == [
+        {"period": "2020-01", "count": 2},
+        {"period": "2021-05", "count": 1},
+    ]
+    assert sum(postcode["count"] for postcode in result["postcode_counts"]) == 3
+    assert all(postcode["postcode"] in {"2100", "2101", "2102"} for postcode in result["postcode_counts"])
+    assert result["custom_field_frequencies"] == {
+        "level": [{"value": "gold", "count": 2}, {"value": "silver", "count": 1}]
+    }
+
+    # Served from the cache until the next write
+    assert client.get("/analytics").json() == result
+    assert len(computed) == 1
+
+    client.patch(f"/members/{members[2]['id']}", json={"custom_fields": {"level": "gold"}})
+    updated = client.get("/analytics").json()
+    assert len(computed) == 2
+    assert updated["version"] > result["version"]
+    assert updated["custom_field_frequencies"] == {"level": [{"value": "gold", "count": 3}]}
+
 def test_create_custom_field(test_db):
     """Test creating a custom field"""
     field_data = {
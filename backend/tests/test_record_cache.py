@@ -0,0 +1,103 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api import routes
+from app.core.writer import run_write
+from app.services import record_cache
+from app.services.record_cache import LRUCache, member_cache, custom_field_cache
+from conftest import insert_member
+from uuid import uuid4
+import time
+
+client = TestClient(app)
+
+READS = 500
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    loads = []
+
+    def get(key):
+        return cache.get(key, lambda: loads.append(key) or key.upper())
+
+    assert get("a") == "A"
+    assert get("b") == "B"
+    assert get("a") == "A"
+    assert get("c") == "C"
+    # "b" was used least recently, so it was evicted to make room for "c"
+    assert get("b") == "B"
+    assert get("a") == "A"
+    assert loads == ["a", "b", "c", "b", "a"]
+    assert cache.stats() == {"entries": 2, "max_entries": 2, "hits": 1, "misses": 5}
+
+    # Nothing found is not cached
+    assert cache.get("d", lambda: None) is None
+    assert cache.stats()["entries"] == 2
+
+def test_load_overlapping_an_invalidation_is_not_stored():
+    cache = LRUCache(10)
+    # A write commits and invalidates while the read is still loading the old value
+    assert cache.get("a", lambda: cache.invalidate("a") or "stale") == "stale"
+    assert cache.get("a", lambda: "fresh") == "fresh"
+
+def test_writes_invalidate_cached_records(test_db):
+    member_id = str(uuid4())
+    run_write(lambda db: insert_member(db, member_id))
+    field_id = client.post("/custom-fields", json={"name": "level", "field_type": "string", "validation_rules": {}}).json()["id"]
+
+    assert client.get(f"/members/{member_id}").json()["custom_fields"] == {"level": ""}
+    assert client.get(f"/members/{member_id}").json()["first_name"] == "Anna"
+    assert member_cache.hits == 1
+
+    client.patch(f"/members/{member_id}", json={"first_name": "Mette", "custom_fields": {"level": "gold"}})
+    member = client.get(f"/members/{member_id}").json()
+    assert member["first_name"] == "Mette"
+    assert member["custom_fields"] == {"level": "gold"}
+
+    assert client.get(f"/custom-fields/{field_id}").json()["name"] == "level"
+    client.patch(f"/custom-fields/{field_id}", json={"name": "tier"})
+    assert client.get(f"/custom-fields/{field_id}").json()["name"] == "tier"
+    assert [field["name"] for field in client.get("/custom-fields").json()] == ["tier"]
+    assert client.get(f"/members/{member_id}").json()["custom_fields"] == {"tier": "gold"}
+
+    client.post("/custom-fields", json={"name": "team", "field_type": "string", "validation_rules": {}})
+    assert client.get(f"/members/{member_id}").json()["custom_fields"] == {"tier": "gold", "team": ""}
+    assert len(client.get("/custom-fields").json()) == 2
+
+    client.delete(f"/custom-fields/{field_id}")
+    assert client.get(f"/custom-fields/{field_id}").status_code == 404
+    assert client.get(f"/members/{member_id}").json()["custom_fields"] == {"team": ""}
+
+    client.delete(f"/members/{member_id}")
+    assert client.get(f"/members/{member_id}").status_code == 404
+
+    stats = client.get("/cache/stats").json()
+    assert stats["members"]["hits"] == member_cache.hits > 0
+    assert stats["custom_fields"]["misses"] == custom_field_cache.misses > 0
+
+def test_cached_reads_are_faster(test_db, monkeypatch, record_property):
+    member_id = str(uuid4())
+    run_write(lambda db: insert_member(db, member_id))
+    for name in ["level", "team", "region"]:
+        client.post("/custom-fields", json={"name": name, "field_type": "string", "validation_rules": {}})
+
+    def read_repeatedly():
+        start = time.perf_counter()
+        for _ in range(READS):
+            routes.get_member(member_id)
+            routes.get_custom_field(routes.list_custom_fields()[0].id)
+        return time.perf_counter() - start
+
+    # A cache that cannot hold anything reads through to DuckDB every time
+    monkeypatch.setattr(routes, "member_cache", LRUCache(0))
+    monkeypatch.setattr(routes, "custom_field_cache", LRUCache(0))
+    uncached = read_repeatedly()
+    monkeypatch.undo()
+
+    record_cache.clear_record_caches()
+    cached = read_repeatedly()
+
+    record_property("uncached_ms_per_read", round(uncached * 1e3 / READS, 3))
+    record_property("cached_ms_per_read", round(cached * 1e3 / READS, 3))
+    assert member_cache.stats()["misses"] == 1
+    assert member_cache.stats()["hits"] == READS - 1
+    assert cached < uncached
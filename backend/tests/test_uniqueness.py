@@ -0,0 +1,64 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.writer import run_write
+from app.services.uniqueness import UniquenessRegistry, registry
+from conftest import insert_member
+import os
+import random
+import time
+
+client = TestClient(app)
+
+# Set UNIQUENESS_ROWS=1000000 to check the full-scale case, the default keeps the suite fast
+ROWS = int(os.getenv("UNIQUENESS_ROWS", "50000"))
+
+def test_claims_stay_unique_and_constant_time(record_property):
+    members = UniquenessRegistry()
+    members.ensure_loaded()
+    rng = random.Random(0)
+    # Few enough distinct values that most claims collide, and with each other's mutations
+    local_parts = [f"member{i}" for i in range(ROWS // 4)]
+    phone_numbers = [f"+45 {rng.randrange(10 ** 8):08d}" for _ in range(ROWS // 4)]
+
+    start = time.perf_counter()
+    emails = {members.claim_email(f"{rng.choice(local_parts)}@example.com") for _ in range(ROWS)}
+    phones = {members.claim_phone(rng.choice(phone_numbers)) for _ in range(ROWS)}
+    elapsed = time.perf_counter() - start
+
+    record_property("us_per_claim", round(elapsed / (2 * ROWS) * 1e6, 2))
+    record_property("lookups_per_claim", round(members.probes / (2 * ROWS), 2))
+    assert len(emails) == ROWS
+    assert len(phones) == ROWS
+    assert members.probes < 3 * 2 * ROWS
+
+def test_claim_changes_only_the_suffix():
+    members = UniquenessRegistry()
+    members.ensure_loaded()
+
+    assert members.claim_email("Anna.Jensen@example.com") == "Anna.Jensen@example.com"
+    assert members.claim_email("anna.jensen@EXAMPLE.com") == "anna.jensen2@EXAMPLE.com"
+    assert members.claim_email("anna.jensen2@example.com") == "anna.jensen22@example.com"
+    assert members.claim_phone("+45 12 34 56 78") == "+45 12 34 56 78"
+    assert members.claim_phone("+4512345678") == "+4512345679"
+    assert members.claim_phone("+45 12 34 56 78") == "+45 12 34 56 80"
+    assert members.claim_phone("+45 99 99 99 99") == "+45 99 99 99 99"
+    assert members.claim_phone("+45 99 99 99 99") == "+45 99 00 00 00"
+
+def test_registry_follows_writes(test_db):
+    from uuid import uuid4
+    member_id = str(uuid4())
+    run_write(lambda db: insert_member(db, member_id, "anna@example.com", "+45 11111111"))
+
+    registry.ensure_loaded()
+    assert registry.has_name("anna", "jensen")
+    assert registry.claim_email("anna@example.com") == "anna2@example.com"
+
+    client.patch(f"/members/{member_id}", json={"email": "anna.j@example.com", "first_name": "Mette"})
+    assert not registry.has_name("Anna", "Jensen")
+    assert registry.has_name("Mette", "Jensen")
+    assert registry.claim_email("anna@example.com") == "anna@example.com"
+    assert registry.claim_email("anna.j@example.com") == "anna.j2@example.com"
+
+    client.delete(f"/members/{member_id}")
+    assert not registry.has_name("Mette", "Jensen")
+    assert registry.claim_phone("+45 11111111") == "+45 11111111"
@@ -0,0 +1,134 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import get_db
+from app.core.writer import PartialWriteError, WriteCoordinator, run_write
+from concurrent.futures import ThreadPoolExecutor
+from conftest import insert_member
+from uuid import uuid4
+import threading
+import time
+import pytest
+
+client = TestClient(app)
+
+WORKERS = 8
+WRITES_PER_WORKER = 50
+
+def test_group_commit_across_workers(test_db, record_property):
+    writer = WriteCoordinator()
+    member_ids = [str(uuid4()) for _ in range(WORKERS * WRITES_PER_WORKER)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        list(pool.map(lambda member_id: writer.submit(lambda db: insert_member(db, member_id)), member_ids))
+    elapsed = time.perf_counter() - start
+    writer.stop()
+
+    record_property("writes_per_second", round(len(member_ids) / elapsed))
+    record_property("commits", writer.committed_batches)
+    assert writer.committed_jobs == len(member_ids)
+    assert writer.committed_batches < len(member_ids)
+    assert get_db().execute("SELECT count(*) FROM members").fetchone()[0] == len(member_ids)
+
+def test_failing_job_does_not_abort_its_batch(test_db):
+    writer = WriteCoordinator()
+    started = threading.Event()
+    gate = threading.Event()
+
+    def blocking(db):
+        started.set()
+        gate.wait()
+
+    def failing(db):
+        insert_member(db, str(uuid4()))
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        # Hold the writer busy until the other three jobs are queued, so they are committed as one batch
+        blocker = pool.submit(writer.submit, blocking)
+        started.wait()
+        first = pool.submit(writer.submit, lambda db: insert_member(db, str(uuid4())))
+        bad = pool.submit(writer.submit, failing)
+        second = pool.submit(writer.submit, lambda db: insert_member(db, str(uuid4())))
+        while writer._queue.qsize() < 3:
+            time.sleep(0.01)
+        gate.set()
+
+        blocker.result()
+        first.result()
+        second.result()
+        with pytest.raises(ValueError):
+            bad.result()
+    writer.stop()
+
+    # The blocker's batch, then the failed batch of three retried one job at a time
+    assert writer.committed_batches == 3
+    assert get_db().execute("SELECT count(*) FROM members").fetchone()[0] == 2
+
+def test_staged_job_commits_each_stage(test_db):
+    member_id = str(uuid4())
+    run_write(lambda db: insert_member(db, member_id))
+    field_id = client.post("/custom-fields", json={"name": "level", "field_type": "string", "validation_rules": {}}).json()["id"]
+
+    # A foreign key referenced row can only be deleted after the referencing rows are gone
+    assert run_write(
+        lambda db: db.execute("DELETE FROM custom_field_values WHERE member_id = ?", [member_id]),
+        lambda db: db.execute("DELETE FROM members WHERE id = ?", [member_id]) and "deleted",
+    ) == "deleted"
+
+    def fail(db):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        run_write(fail, lambda db: db.execute("DELETE FROM members"))
+
+    # A later stage failing reports what the committed stages returned
+    with pytest.raises(PartialWriteError) as error:
+        run_write(lambda db: db.execute("DELETE FROM custom_field_values WHERE field_id = ?", [field_id]) and "values", fail)
+    assert error.value.results == ["values"]
+    assert isinstance(error.value.__cause__, ValueError)
+    assert get_db().execute("SELECT count(*) FROM members").fetchone()[0] == 0
+
+def test_failed_member_delete_restores_custom_field_values(test_db, monkeypatch):
+    from app.api import routes
+    member_id = str(uuid4())
+    run_write(lambda db: insert_member(db, member_id))
+    client.post("/custom-fields", json={"name": "level", "field_type": "string", "validation_rules": {}})
+    client.patch(f"/members/{member_id}", json={"custom_fields": {"level": "gold"}})
+
+    def fail(db, member_id):
+        raise ValueError("boom")
+
+    # member_keys runs in the second stage, after the values were deleted
+    monkeypatch.setattr(routes, "member_keys", fail)
+    response = TestClient(app, raise_server_exceptions=False).delete(f"/members/{member_id}")
+    assert response.status_code == 500
+    monkeypatch.undo()
+
+    assert client.get(f"/members/{member_id}").json()["custom_fields"] == {"level": "gold"}
+    assert client.get("/members/search", params={"q": "gold", "field": "level"}).json()["total"] == 1
+
+def test_concurrent_api_writes_have_no_lock_errors(test_db, record_property):
+    member_ids = [str(uuid4()) for _ in range(WORKERS)]
+    run_write(lambda db: [insert_member(db, member_id) for member_id in member_ids])
+    client.post("/custom-fields", json={"name": "level", "field_type": "string", "validation_rules": {}})
+
+    def patch_member(worker):
+        statuses = []
+        for i in range(WRITES_PER_WORKER // 5):
+            # Every worker writes to every member, so the same rows are updated concurrently
+            member_id = member_ids[(worker + i) % len(member_ids)]
+            response = client.patch(f"/members/{member_id}", json={
+                "first_name": f"Worker{worker}",
+                "custom_fields": {"level": str(i)},
+            })
+            statuses.append(response.status_code)
+        return statuses
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        statuses = [status for result in pool.map(patch_member, range(WORKERS)) for status in result]
+    elapsed = time.perf_counter() - start
+
+    record_property("requests_per_second", round(len(statuses) / elapsed))
+    assert statuses == [200] * len(statuses)